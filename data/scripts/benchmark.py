@@ -0,0 +1,289 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+
+def _timeit(f, repeat=3):
+    '''
+    Runs f() *repeat* times and returns the best wall time (in seconds) and the result of the last run.
+    '''
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = f()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def _elections_span_text_pairs():
+    '''
+    :return: list of (span, tweet) pairs taken from the Elections cue, target, stimulus and experiencer annotations.
+    '''
+    from elections2json import _load as _load_elections, Q2_1_PATH, Q2_2_PATH, blank_tags
+
+    pairs = []
+    for row in _load_elections(Q2_1_PATH, questionnaire=2) + _load_elections(Q2_2_PATH, questionnaire=2):
+        tweet = " ".join(row["tweet"].split())
+        for role in ["span_supporting_emotion", "target", "emotion_stimulus", "experiencer"]:
+            if row[role].lower() not in blank_tags:
+                pairs.append((row[role], tweet))
+    return pairs
+
+
+def benchmark_fuzzy_search(max_typos=5, repeat=3):
+    '''
+    Compares the "regex" and "edlib" fuzzy_search engines on the real Elections span/tweet pairs.
+    '''
+    from utils.strings import fuzzy_search, _FUZZY_PATTERN_CACHE
+
+    pairs = _elections_span_text_pairs()
+    timings, results = {}, {}
+    for engine in ["regex", "edlib"]:
+        _FUZZY_PATTERN_CACHE.clear()
+        timings[engine], results[engine] = _timeit(
+            lambda: [fuzzy_search(s, t, max_typos=max_typos, engine=engine) for s, t in pairs], repeat=repeat)
+    same = sum(1 for a, b in zip(results["regex"], results["edlib"]) if a == b)
+    print(f"pairs={len(pairs)}, max_typos={max_typos}")
+    for engine, t in timings.items():
+        print(f"{engine}: {round(t, 3)}s ({round(1e6 * t / len(pairs), 1)}us/pair)")
+    print(f"identical spans={same}/{len(pairs)}={round(same / len(pairs), 3)}")
+
+
+def benchmark_import_utils(repeat=3):
+    '''
+    Measures (in fresh interpreters) the import time of utils and utils.emojis, with python -X importtime, and the time
+    needed to load the emoji tables and compile the emoji regexp on first use.
+    '''
+    code = "import time, utils, utils.emojis as e; t = time.perf_counter(); e.get_emoji_regexp(); " \
+           "print(time.perf_counter() - t)"
+    timings = {"utils": [], "utils.emojis": [], "first get_emoji_regexp()": []}
+    for _ in range(repeat):
+        p = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                           cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+        for line in p.stderr.splitlines():
+            m = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s+(\S+)$", line.strip())
+            if m and m.group(2) in timings:
+                timings[m.group(2)].append(int(m.group(1)) / 1e6)
+        timings["first get_emoji_regexp()"].append(float(p.stdout.strip()))
+    for name, t in timings.items():
+        print(f"{name}: {round(1000 * min(t), 1)}ms")
+
+
+def benchmark_emoji_matcher(repeat=3):
+    '''
+    Compares the sorted alternation emoji regexp (get_emoji_regexp_pattern) with the trie-based EmojiMatcher on the
+    EmoTweet tweets: build time, scanning time, emoji space collapsing time and identical results.
+    '''
+    import re
+    from utils.emojis import get_emoji_regexp_pattern, EmojiMatcher
+    from emotweet2json import _load as _load_emotweet, EMOTWEET_PATH
+
+    texts = [row[1] for row in _load_emotweet(EMOTWEET_PATH)]
+    t_alternation, alternation = _timeit(lambda: re.compile(get_emoji_regexp_pattern()), repeat=1)
+    t_trie, matcher = _timeit(lambda: EmojiMatcher(), repeat=1)
+    print(f"texts={len(texts)}")
+    print(f"build: alternation={round(t_alternation, 3)}s, trie={round(t_trie, 3)}s")
+
+    t_alternation, found_alternation = _timeit(
+        lambda: [[m.span() for m in alternation.finditer(t)] for t in texts], repeat=repeat)
+    t_trie, found_trie = _timeit(lambda: [matcher.find_emojis(t) for t in texts], repeat=repeat)
+    same = sum(1 for a, b in zip(found_alternation, found_trie) if a == b)
+    print(f"find: alternation={round(t_alternation, 3)}s, trie={round(t_trie, 3)}s, identical={same}/{len(texts)}")
+
+    pattern = alternation.pattern
+    f = lambda x: re.sub(pattern + r"(\s+)" + pattern, r"\g<1>\g<3>", x)
+    t_alternation, collapsed_alternation = _timeit(lambda: [f(f(t)) for t in texts], repeat=repeat)
+    t_trie, collapsed_trie = _timeit(lambda: [matcher.collapse_emoji_spaces(t) for t in texts], repeat=repeat)
+    same = sum(1 for a, b in zip(collapsed_alternation, collapsed_trie) if a == b)
+    print(f"collapse spaces: alternation={round(t_alternation, 3)}s, trie={round(t_trie, 3)}s, "
+          f"identical={same}/{len(texts)}")
+
+
+def _ntcir_load_reference(path):
+    '''
+    Previous NTCIR loader, kept as reference: whole file read in memory, regex split, ElementTree parse, serialization
+    and xmltodict parse of each document.
+    '''
+    import xml.etree.ElementTree as ET
+    import xmltodict
+
+    with open(path, "r") as f:
+        xmlstring = f.read()
+        xmlstring = xmlstring.replace("?/text>", "</text>")
+        xmlstring = xmlstring.replace("?/cause>", "</cause>")
+    data = []
+    for m in re.finditer(r"<\?xml version.*?<\/emotionml>", xmlstring, flags=re.DOTALL):
+        b, e = m.span()
+        xml_data = ET.fromstring(xmlstring[b:e])
+        xmlstr = ET.tostring(xml_data, encoding='utf-8', method='xml')
+        data.append(dict(xmltodict.parse(xmlstr, strip_whitespace=False)))
+    return data
+
+
+def benchmark_ntcir_loader(repeat=3):
+    '''
+    Compares the streaming NTCIR loader with the previous one (time, peak traced memory and identical documents).
+    '''
+    import tracemalloc
+    from ntcir2json import _load, NTCIR_TRAIN_EN_PATH, NTCIR_TEST_EN_PATH, NTCIR_TRAIN_CH_PATH, NTCIR_TEST_CH_PATH
+
+    def _consume(documents):
+        # the converter only keeps the preprocessed documents, so the loaded ones are only iterated
+        count = 0
+        for _ in documents:
+            count += 1
+        return count
+
+    for path in [NTCIR_TRAIN_EN_PATH, NTCIR_TEST_EN_PATH, NTCIR_TRAIN_CH_PATH, NTCIR_TEST_CH_PATH]:
+        print(os.path.basename(path))
+        for name, loader in [("reference", _ntcir_load_reference), ("streaming", _load)]:
+            t, count = _timeit(lambda: _consume(loader(path)), repeat=repeat)
+            tracemalloc.start()
+            _consume(loader(path))
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"  {name}: documents={count}, time={round(t, 3)}s, peak_memory={round(peak / 2 ** 20, 1)}MB")
+        same = _ntcir_load_reference(path) == list(_load(path))
+        print(f"  identical={same}")
+
+
+def benchmark_reman_loader(repeat=3):
+    '''
+    Compares the streaming REMAN loader (with and without schema validation) with xmlschema to_dict on the whole file:
+    time to the first document, total time, peak traced memory and identical documents.
+    '''
+    import json
+    import tracemalloc
+    import xmlschema
+    from reman2json import _load, REMAN_PATH, REMAN_SCHEMA_PATH
+
+    loaders = [
+        ("to_dict", lambda: iter(xmlschema.XMLSchema(REMAN_SCHEMA_PATH).to_dict(REMAN_PATH)["document"])),
+        ("streaming", lambda: _load(REMAN_PATH, REMAN_SCHEMA_PATH)),
+        ("streaming+validate", lambda: _load(REMAN_PATH, REMAN_SCHEMA_PATH, validate=True))
+    ]
+    for name, loader in loaders:
+        t_first, _ = _timeit(lambda: next(loader()), repeat=repeat)
+        t, count = _timeit(lambda: sum(1 for _ in loader()), repeat=repeat)
+        tracemalloc.start()
+        for _ in loader():
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{name}: documents={count}, first_document={round(t_first, 3)}s, time={round(t, 3)}s, "
+              f"peak_memory={round(peak / 2 ** 20, 1)}MB")
+    # to_dict returns OrderedDicts and Decimals where the schema says so: compare the serialized documents
+    reference = json.dumps(xmlschema.XMLSchema(REMAN_SCHEMA_PATH).to_dict(REMAN_PATH)["document"], default=str)
+    print(f"identical={reference == json.dumps(list(_load(REMAN_PATH, REMAN_SCHEMA_PATH)), default=str)}")
+
+
+def benchmark_tokenizers(repeat=3):
+    '''
+    Measures the per-tweet tokenization cost of the Elections adjudication: tokenizers built for each tweet (a
+    TweetTokenizer per tweet and a RegexpTokenizer per split_longest_common_substrings call, as before) against the
+    shared, memoized registry tokenizer.
+    '''
+    from itertools import groupby
+    from nltk.tokenize import TweetTokenizer, RegexpTokenizer
+    from utils.tokenizers import get_tokenizer
+
+    pairs = _elections_span_text_pairs()
+    tweets = [(tweet, [span for span, _ in group]) for tweet, group in groupby(pairs, key=lambda p: p[1])]
+
+    def _per_call():
+        for tweet, spans in tweets:
+            TweetTokenizer()
+            for span in spans:
+                tokenizer = RegexpTokenizer(r'\w+')
+                tokenizer.tokenize(span), tokenizer.tokenize(tweet)
+
+    def _registry():
+        tokenize = get_tokenizer("word").tokenize
+        for tweet, spans in tweets:
+            tokenize(tweet)
+            for span in spans:
+                tokenize(span)
+
+    get_tokenizer("word").cache_clear()
+    t_per_call, _ = _timeit(_per_call, repeat=repeat)
+    t_registry, _ = _timeit(_registry, repeat=repeat)
+    print(f"tweets={len(tweets)}, spans={len(pairs)}")
+    print(f"per call: {round(t_per_call, 3)}s ({round(1e6 * t_per_call / len(tweets), 1)}us/tweet)")
+    print(f"registry: {round(t_registry, 3)}s ({round(1e6 * t_registry / len(tweets), 1)}us/tweet), "
+          f"cache={get_tokenizer('word').cache_info()}")
+
+
+def _deep_flatten_reference(element_or_list):
+    '''
+    Previous deep_flatten, kept as reference: recursive generators.
+    '''
+    def _iter_all_generator(elem):
+        if isinstance(elem, list):
+            for el in elem:
+                yield from _iter_all_generator(el)
+        else:
+            yield elem
+    g = _iter_all_generator(element_or_list)
+    return [e for e in g]
+
+
+def benchmark_deep_flatten(repeat=3):
+    '''
+    Compares deep_flatten with the previous recursive one on the GNE annotation fields (all the "gold" values, i.e. the
+    shapes deep_flatten gets in gne2json), grouped by nesting depth, and flatten_spans with list comprehensions on
+    per-annotator span lists.
+    '''
+    import json
+    import random
+    import numpy as np
+    from utils.data import deep_flatten, flatten_spans
+    from gne2json import news_titles_path
+
+    def _depth(x):
+        return 1 + max((_depth(e) for e in x), default=0) if isinstance(x, list) else 0
+
+    by_depth = {}
+    with open(news_titles_path) as f:
+        for line in f:
+            for annotation in json.loads(line)["annotations"].values():
+                by_depth.setdefault(_depth(annotation["gold"]), []).append(annotation["gold"])
+    for depth, values in sorted(by_depth.items()):
+        t_reference, reference = _timeit(lambda: [_deep_flatten_reference(v) for v in values], repeat=repeat)
+        t_iterative, iterative = _timeit(lambda: [deep_flatten(v) for v in values], repeat=repeat)
+        print(f"deep_flatten depth={depth} values={len(values)}: reference={round(t_reference, 3)}s, "
+              f"iterative={round(t_iterative, 3)}s, identical={reference == iterative}")
+
+    # annotators x spans, as the span positions adjudicated by find_span_annotation_intersections
+    random.seed(0)
+    spans = [[[(b, b + random.randint(1, 20)) for b in random.sample(range(100), random.randint(0, 4))]
+              for _ in range(random.randint(1, 5))] for _ in range(10000)]
+    t_list, arrays_list = _timeit(lambda: [np.asarray([s for a in x for s in a], dtype=np.int64).reshape(-1, 2)
+                                           for x in spans], repeat=repeat)
+    t_spans, arrays_spans = _timeit(lambda: [flatten_spans(x) for x in spans], repeat=repeat)
+    out = np.empty((100, 2), dtype=np.int64)
+    t_out, _ = _timeit(lambda: [flatten_spans(x, out=out) for x in spans], repeat=repeat)
+    same = all(np.array_equal(a, b) for a, b in zip(arrays_list, arrays_spans))
+    print(f"flatten_spans values={len(spans)}: list+asarray={round(t_list, 3)}s, flatten_spans={round(t_spans, 3)}s, "
+          f"flatten_spans(out)={round(t_out, 3)}s, identical={same}")
+
+
+_BENCHMARKS = {
+    "fuzzy_search": benchmark_fuzzy_search,
+    "import_utils": benchmark_import_utils,
+    "emoji_matcher": benchmark_emoji_matcher,
+    "ntcir_loader": benchmark_ntcir_loader,
+    "reman_loader": benchmark_reman_loader,
+    "tokenizers": benchmark_tokenizers,
+    "deep_flatten": benchmark_deep_flatten,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the SRL4E conversion utilities.")
+    parser.add_argument("benchmark", choices=sorted(_BENCHMARKS.keys()))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    _BENCHMARKS[args.benchmark](repeat=args.repeat)
@@ -1,6 +1,7 @@
-import json
+import argparse
 import warnings
 from utils import find_span_annotation_intersections
+from utils.srl4e import SRL4EWriter
 import re
 
 BLOGS_BASE_PATH = "../datasets/blogs/Emotion-Data/Annotated Data/basefile.txt"
@@ -69,11 +70,15 @@ def _load(data_path):
     return result
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jsonl", action="store_true", help="stream the records to a JSONL file instead of a JSON one")
+    args = parser.parse_args()
+
     raw_base = _load(BLOGS_BASE_PATH)
     raw_1 = _load(BLOGS_1_PATH)
     raw_2 = _load(BLOGS_2_PATH)
 
-    result = {}
+    result = SRL4EWriter("SRL4E_blogs.json", jsonl=args.jsonl)
     counter = 0
     for index, data in enumerate(zip(raw_base, raw_1, raw_2)):
         index = "blogs." + str(index).zfill(7)
@@ -162,5 +167,4 @@ if __name__ == "__main__":
         #result[index]["emotions"][emotion_index]["roles"]["experiencer"] = labels["experiencer"]
         #result[index]["emotions"][emotion_index]["roles"]["target"] = labels["target"]
         #result[index]["emotions"][emotion_index]["roles"]["cause"] = labels["cause"]
-    with open("SRL4E_blogs.json", "w") as f:
-        json.dump(result, f, sort_keys=True, indent=4)
+    result.close()
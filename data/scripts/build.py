@@ -0,0 +1,217 @@
+import argparse
+import ast
+import os
+import re
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.cache import fingerprint_files
+from utils.srl4e import iter_srl4e, write_srl4e_binary
+from utils.tokens import TokenIndex
+
+SCRIPTS_PATH = os.path.dirname(os.path.abspath(__file__))
+CONVERTERS = ["blogs2json", "elections2json", "emotweet2json", "gne2json", "ntcir2json", "reman2json"]
+CACHE_PATH = ".build_cache"
+# converters that can reuse their already converted records (see utils.cache.RecordCache) and span alignments (see
+# utils.strings.SpanAligner)
+_RECORD_CACHE_ARGS = {
+    "elections2json": ["--record-cache", os.path.join(CACHE_PATH, "elections2json.records.json"),
+                       "--alignment-cache", os.path.join(CACHE_PATH, "elections2json.alignments.sqlite")],
+    "emotweet2json": ["--alignment-cache", os.path.join(CACHE_PATH, "emotweet2json.alignments.sqlite")]
+}
+
+
+def _converter_io(name, jsonl=False):
+    '''
+    Finds the raw inputs and the outputs of a converter from its source: inputs are the module level string constants
+    whose name ends with "path" (e.g. REMAN_PATH), outputs are the "SRL4E_*.json" string literals.
+    :param name: converter name (e.g. "gne2json")
+    :param jsonl: whether the converter writes JSONL outputs (see utils.srl4e.SRL4EWriter)
+    :return: (list of input paths, list of output paths), relative to SCRIPTS_PATH
+    '''
+    with open(os.path.join(SCRIPTS_PATH, name + ".py")) as f:
+        tree = ast.parse(f.read())
+    inputs, outputs = [], []
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.Constant) and type(node.value.value) is str:
+            if any(isinstance(t, ast.Name) and t.id.lower().endswith("path") for t in node.targets):
+                inputs.append(node.value.value)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and type(node.value) is str and re.fullmatch(r"SRL4E_\w+\.json", node.value):
+            outputs.append(node.value)
+    if jsonl:
+        outputs = [os.path.splitext(o)[0] + ".jsonl" for o in outputs]
+    return inputs, sorted(set(outputs))
+
+
+def _fingerprint(name):
+    '''
+    :return: fingerprint of a converter: its source, the utils package and its raw input files
+    '''
+    inputs, _ = _converter_io(name)
+    return fingerprint_files([name + ".py", "utils"] + inputs, root=SCRIPTS_PATH)
+
+
+def _fingerprint_path(name, jsonl=False):
+    return os.path.join(SCRIPTS_PATH, CACHE_PATH, name + (".jsonl" if jsonl else "") + ".fingerprint")
+
+
+def _is_up_to_date(name, jsonl=False):
+    '''
+    :return: True if the converter outputs exist and were built from the current code and raw inputs
+    '''
+    _, outputs = _converter_io(name, jsonl)
+    fingerprint_path = _fingerprint_path(name, jsonl)
+    if not os.path.isfile(fingerprint_path) or not all(os.path.isfile(os.path.join(SCRIPTS_PATH, o)) for o in outputs):
+        return False
+    with open(fingerprint_path) as f:
+        return f.read() == _fingerprint(name)
+
+
+def _run_converter(name, log_dir, incremental=True, jsonl=False):
+    '''
+    Runs a converter script in its own process, redirecting its stdout and stderr (i.e. warnings) to separate files.
+    :param name: converter name (e.g. "gne2json")
+    :param log_dir: directory where "<name>.out" and "<name>.err" are written
+    :param incremental: if True, the converter is skipped when up to date, and converted records are reused
+    :param jsonl: whether the converter streams its records to JSONL files
+    :return: dict with converter name, exit code, wall time (seconds), peak RSS (MB), amount of warnings, log paths and
+    whether it was skipped
+    '''
+    if incremental and _is_up_to_date(name, jsonl):
+        return {"converter": name, "exit_code": 0, "skipped": True}
+    fingerprint = _fingerprint(name)
+    args = list(_RECORD_CACHE_ARGS.get(name, [])) if incremental else []
+    args += ["--jsonl"] if jsonl else []
+    out_path, err_path = os.path.join(log_dir, name + ".out"), os.path.join(log_dir, name + ".err")
+    start = time.perf_counter()
+    with open(out_path, "w") as out, open(err_path, "w") as err:
+        process = subprocess.Popen([sys.executable, name + ".py"] + args, cwd=SCRIPTS_PATH, stdout=out, stderr=err)
+        # wait4 (instead of Popen.wait) also returns the resource usage of this child only. It reaps the child, so
+        # the exit code is given back to the Popen object (otherwise it would still consider the child running)
+        _, status, rusage = os.wait4(process.pid, 0)
+        process.returncode = exit_code = os.waitstatus_to_exitcode(status)
+    wall_time = time.perf_counter() - start
+    with open(err_path) as f:
+        warnings_count = sum(1 for line in f if re.search(r"\w*Warning: ", line))
+    if exit_code == 0:
+        os.makedirs(os.path.join(SCRIPTS_PATH, CACHE_PATH), exist_ok=True)
+        with open(_fingerprint_path(name, jsonl), "w") as f:
+            f.write(fingerprint)
+    return {
+        "converter": name,
+        "skipped": False,
+        "exit_code": exit_code,
+        "wall_time": wall_time,
+        "peak_rss": rusage.ru_maxrss / 1024,  # ru_maxrss is in KB on Linux
+        "warnings": warnings_count,
+        "stdout": out_path,
+        "stderr": err_path
+    }
+
+
+def build(converters=None, workers=None, log_dir="logs", incremental=True, jsonl=False):
+    '''
+    Runs the converters in parallel. Each converter is run in its own process, at most *workers* at a time.
+    With *incremental*, converters whose code, utils and raw inputs did not change since their last successful run are
+    skipped.
+    :param converters: list of converter names to run. If None, all the converters are run
+    :param workers: maximum amount of converters running at the same time. If None, the amount of CPUs is used
+    :param log_dir: directory where the stdout and stderr of each converter are saved
+    :param incremental: if False, all the converters are run from scratch
+    :param jsonl: if True, the converters write SRL4E_*.jsonl files instead of SRL4E_*.json
+    :return: list of reports (see _run_converter), in the same order of *converters*
+    '''
+    converters = CONVERTERS if converters is None else converters
+    assert all(c in CONVERTERS for c in converters), f"converters must be in {CONVERTERS}"
+    log_dir = os.path.join(SCRIPTS_PATH, log_dir)
+    os.makedirs(log_dir, exist_ok=True)
+    # the actual work is done by the child processes: threads are only needed to wait for them
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        reports = list(executor.map(lambda c: _run_converter(c, log_dir, incremental, jsonl), converters))
+    return reports
+
+
+def _derive_outputs(converters, jsonl, force, suffix, derive):
+    '''
+    Builds a derived file next to each converter output (e.g. SRL4E_gne.tokens.npz for SRL4E_gne.json).
+    :param converters: list of converter names whose outputs are considered. If None, all the converters are considered
+    :param jsonl: whether the converters wrote SRL4E_*.jsonl files
+    :param force: if False, derived files that are newer than their SRL4E file are not rebuilt
+    :param suffix: replaces the extension of the SRL4E file to get the derived file path
+    :param derive: function (SRL4E path, derived path) -> amount of records
+    :return: list of (derived path, amount of records), None instead of the amount for skipped files
+    '''
+    reports = []
+    for name in CONVERTERS if converters is None else converters:
+        for output in _converter_io(name, jsonl)[1]:
+            output = os.path.join(SCRIPTS_PATH, output)
+            derived = os.path.splitext(output)[0] + suffix
+            if not os.path.isfile(output):
+                continue
+            # directories are stamped by their meta.json, which is written last
+            stamp = os.path.join(derived, "meta.json") if os.path.isdir(derived) else derived
+            if not force and os.path.isfile(stamp) and os.path.getmtime(stamp) >= os.path.getmtime(output):
+                reports.append((derived, None))
+                continue
+            reports.append((derived, derive(output, derived)))
+    return reports
+
+
+def _build_token_index(path, tokens_path):
+    index = TokenIndex.from_records(iter_srl4e(path))
+    index.save(tokens_path)
+    return len(index)
+
+
+def build_token_indices(converters=None, jsonl=False, force=False):
+    '''
+    Tokenizes the records of the converter outputs and aligns their role spans to the tokens once, saving a
+    utils.tokens.TokenIndex next to each output (e.g. SRL4E_gne.tokens.npz for SRL4E_gne.json).
+    See _derive_outputs for the arguments and the returned value.
+    '''
+    return _derive_outputs(converters, jsonl, force, ".tokens.npz", _build_token_index)
+
+
+def build_binary_corpora(converters=None, jsonl=False, force=False):
+    '''
+    Converts the converter outputs to the memory-mapped binary format of utils.srl4e.SRL4EBinary (e.g. the
+    SRL4E_gne.srl4e directory for SRL4E_gne.json). See _derive_outputs for the arguments and the returned value.
+    '''
+    return _derive_outputs(converters, jsonl, force, ".srl4e", lambda path, binary_path: write_srl4e_binary(
+        iter_srl4e(path), binary_path))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds the SRL4E datasets, running the converters in parallel.")
+    parser.add_argument("converters", nargs="*", default=CONVERTERS, help="converters to run (default: all)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="parallel converters (default: CPU count)")
+    parser.add_argument("--log-dir", default="logs", help="where to save the stdout/stderr of each converter")
+    parser.add_argument("-f", "--force", action="store_true", help="rebuild everything, even if up to date")
+    parser.add_argument("--jsonl", action="store_true", help="write SRL4E_*.jsonl outputs, one record per line")
+    parser.add_argument("--tokens", action="store_true",
+                        help="also save the token offsets and BIO role labels of each output (SRL4E_*.tokens.npz)")
+    parser.add_argument("--binary", action="store_true",
+                        help="also convert each output to the memory-mapped binary format (SRL4E_*.srl4e)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    reports = build(args.converters, workers=args.workers, log_dir=args.log_dir, incremental=not args.force,
+                    jsonl=args.jsonl)
+    for r in reports:
+        if r["skipped"]:
+            print(f"{r['converter']}: up to date, skipped")
+            continue
+        status = "ok" if r["exit_code"] == 0 else f"FAILED (exit code {r['exit_code']}, see {r['stderr']})"
+        print(f"{r['converter']}: {status}, wall_time={round(r['wall_time'], 1)}s, "
+              f"peak_rss={round(r['peak_rss'], 1)}MB, warnings={r['warnings']}")
+    built = [r["converter"] for r in reports if r["exit_code"] == 0]
+    for enabled, build_stage in [(args.tokens, build_token_indices), (args.binary, build_binary_corpora)]:
+        if enabled:
+            for path, count in build_stage(built, jsonl=args.jsonl, force=args.force):
+                status = "up to date, skipped" if count is None else f"{count} records"
+                print(f"{os.path.relpath(path, SCRIPTS_PATH)}: {status}")
+    print(f"total wall_time={round(time.perf_counter() - start, 1)}s")
+    sys.exit(0 if all(r["exit_code"] == 0 for r in reports) else 1)
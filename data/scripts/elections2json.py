@@ -1,10 +1,15 @@
-import json
+import argparse
+import os
 import warnings
 import pandas as pd
 from itertools import groupby
 from collections import Counter
-from utils import find_span_annotation_intersections, split_longest_common_substrings, merge_contiguous_spans
-from nltk import TweetTokenizer
+from multiprocessing import Pool
+from utils import find_span_annotation_intersections, split_longest_common_substrings, merge_contiguous_spans, TextTokenIndex
+from utils.strings import SpanAligner
+from utils.cache import RecordCache, fingerprint_files
+from utils.srl4e import SRL4EWriter
+from utils.tokenizers import get_tokenizer
 
 Q1_PATH = "../datasets/elections/ElectoralTweetsData/Annotated-US2012-Election-Tweets/Questionnaire1/AnnotatedTweets.txt"
 Q2_1_PATH = "../datasets/elections/ElectoralTweetsData/Annotated-US2012-Election-Tweets/Questionnaire2/Batch1/AnnotatedTweets.txt"
@@ -156,7 +161,189 @@ def _load(path, questionnaire=1):
 
 
 
+def _adjudicate_tweet(tweet, group):
+    '''
+    Adjudicates emotion, sentiment and role spans of a tweet from the annotations of all its annotators.
+    Tweets are independent from each other, so this can run in parallel (see --workers).
+    :param tweet: the tweet text (whitespace normalized)
+    :param group: list of Questionnaire 2 annotations of the tweet
+    :return: the adjudicated dict (text, emotion, sentiment, cue, target, experiencer, stimulus), or None if the tweet
+    cannot be adjudicated
+    '''
+    emotions = [x["emotion"] for x in group]
+    emotions_plutchik = [_emotion2plutchik[x["emotion"]][0] for x in group]
+    trusts = [x["trust"] for x in group]
+    # sentiments = [x["emotion_polarity"] for x in group]
+
+    emotions_plutchik_counts_class = Counter(emotions_plutchik)
+    emotions_plutchik_counts = dict(emotions_plutchik_counts_class.most_common())
+    # are there more then one category with the maximum?
+    _max_p = max(v for k, v in emotions_plutchik_counts.items())
+    if sum(1 for k, v in emotions_plutchik_counts.items() if v == _max_p) > 1:
+        return None  # cannot adjudicate an emotion (no unanimity)
+    # adjudicate using Plutchik emotion
+    emotion, _ = emotions_plutchik_counts_class.most_common(1)[0]
+
+    cues, tgts, stms, exps = [], [], [], []
+    polarities = []
+    for g in group:
+        if _emotion2plutchik[g["emotion"]][0] == emotion:
+            cue = g["span_supporting_emotion"]
+            tgt = g["target"]
+            stm = g["emotion_stimulus"]
+            exp = g["experiencer"]
+            polarity = g["emotion_polarity"]
+
+            if polarity.lower() not in blank_tags:
+                polarities.append(polarity)
+            if cue.lower() not in blank_tags:
+                cues.append(cue)
+            if tgt.lower() not in blank_tags:
+                tgts.append(tgt)
+            if stm.lower() not in blank_tags:
+                stms.append(stm)
+            if exp.lower() not in blank_tags:
+                exps.append(exp)
+
+    sentiment_counts_class = Counter(polarities)
+    sentiment_counts = dict(sentiment_counts_class.most_common())
+    if len(sentiment_counts) == 0:
+        sentiment = _plutchik2sentiment[emotion]  # cannot adjudicate sentiment, must infer from emotion
+    else:
+        # are there more then one category with the maximum?
+        _max_p = max(v for k, v in sentiment_counts.items())
+        if sum(1 for k, v in sentiment_counts.items() if v == _max_p) > 1:
+            sentiment = _plutchik2sentiment[emotion]  # cannot adjudicate sentiment (no unanimity), must infer from emotion
+        else:
+            sentiment, _ = sentiment_counts_class.most_common(1)[0]
+            sentiment = _polaritytag2sentiment[sentiment]  # adjudicated sentiment (unanimity)
+
+
+    # shared, memoized tokenizer (split_longest_common_substrings has always matched \w+ words, so that is the one used)
+    tokenize = get_tokenizer("word").tokenize
+    # tokens and automata of the tweet, shared by all the roles
+    tweet_index = TextTokenIndex(tweet, tokenize)
+    if _aligner is not None:
+        split = lambda x: _aligner.split_longest_common_substrings(x, tweet, "word", index=tweet_index)
+    else:
+        split = lambda x: split_longest_common_substrings(x, tweet, tokenize, index=tweet_index)
+
+    # Adjudicate cue spans
+    cues = [e for e in cues if e.strip().lower() not in tweeter_tags]
+    if len(cues) != 0:
+        cues_smart_split = []
+        for x in cues:
+            smart_split = split(x)
+            if smart_split is not None:
+                cues_smart_split.append(smart_split)
+        try:
+            # cues_smart_split = [split_longest_common_substrings(x, tweet, tokenize) for x in cues]
+            cues = find_span_annotation_intersections(tweet, cues_smart_split, fuzzy=True,
+                                                      occurrences_adjudication=True, max_typos=5, aligner=_aligner)
+        except:
+            warnings.warn(f"Unable to find cue spans {cues} in text '{tweet}'. Skipping...")
+            return None
+
+    # Adjudicate target spans
+    if sum(1 for e in tgts if e.strip().lower() in tweeter_tags) > len(tgts) / 2:
+        tgts = [(-1, -1)]  # target is author
+    else:
+        tgts = [e for e in tgts if e.strip().lower() not in tweeter_tags]
+        if len(tgts) != 0:
+            tgts_smart_split = []
+            for x in tgts:
+                smart_split = split(x)
+                if smart_split is not None:
+                    tgts_smart_split.append(smart_split)
+            try:
+                # tgts_smart_split = [split_longest_common_substrings(x, tweet, tokenize) for x in tgts]
+                tgts = find_span_annotation_intersections(tweet, tgts_smart_split, fuzzy=True,
+                                                          occurrences_adjudication=True, max_typos=5, aligner=_aligner)
+            except:
+                warnings.warn(f"Unable to find target spans {tgts} in text '{tweet}'. Skipping...")
+                return None
+
+    # Adjudicate stimulus spans
+    stms = [e for e in stms if e.strip().lower() not in tweeter_tags]
+    if len(stms) != 0:
+        stms_smart_split = []
+        for x in stms:
+            smart_split = split(x)
+            if smart_split is not None:
+                stms_smart_split.append(smart_split)
+        try:
+            # stms_smart_split = [split_longest_common_substrings(x, tweet, tokenize) for x in stms]
+            stms = find_span_annotation_intersections(tweet, stms_smart_split, fuzzy=True,
+                                                      occurrences_adjudication=True, max_typos=5, aligner=_aligner)
+        except:
+            warnings.warn(f"Unable to find stimulus spans {stms} in text '{tweet}'. Skipping...")
+            return None
+
+    # Adjudicate experiencer spans
+    if sum(1 for e in exps if e.strip().lower() in tweeter_tags) > len(exps) / 2:
+        exps = [(-1, -1)]  # experiencer is author
+    else:
+        exps = [e for e in exps if e.strip().lower() not in tweeter_tags]
+        if len(exps) != 0:
+            exps_smart_split = []
+            for x in exps:
+                smart_split = split(x)
+                if smart_split is not None:
+                    exps_smart_split.append(smart_split)
+            try:
+                # exps_smart_split = [split_longest_common_substrings(x, tweet, tokenize) for x in exps]
+                exps = find_span_annotation_intersections(tweet, exps_smart_split, fuzzy=True,
+                                                          occurrences_adjudication=True, max_typos=5, aligner=_aligner)
+            except:
+                warnings.warn(f"Unable to find experiencer spans {exps} in text '{tweet}'. Skipping...")
+                return None
+
+    # Merge contiguous spans that are separated by space, dash or other special chars
+    cues = merge_contiguous_spans(tweet, cues)
+    tgts = merge_contiguous_spans(tweet, tgts)
+    exps = merge_contiguous_spans(tweet, exps)
+    stms = merge_contiguous_spans(tweet, stms)
+
+    return {
+        "text": tweet,
+        "emotion": emotion,
+        "sentiment": sentiment,
+        "cue": cues,
+        "target": tgts,
+        "experiencer": exps,
+        "stimulus": stms
+    }
+
+
+# memo of the span alignments of this process (see --alignment-cache)
+_aligner = None
+
+def _adjudicate_tweet_star(tweet_group):
+    '''
+    :return: (adjudicated tweet, alignment cache hits, alignment cache misses), so that the cache statistics of the
+    workers can be summed
+    '''
+    if _aligner is None:
+        return _adjudicate_tweet(*tweet_group), 0, 0
+    hits, misses = _aligner.hits, _aligner.misses
+    return _adjudicate_tweet(*tweet_group), _aligner.hits - hits, _aligner.misses - misses
+
+def _open_aligner(path):
+    global _aligner
+    _aligner = SpanAligner(path, flush_every=1)  # flushed at each new alignment: pool workers are not closed
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-w", "--workers", type=int, default=1, help="processes adjudicating tweets in parallel")
+    parser.add_argument("--chunksize", type=int, default=64, help="tweets sent to a worker at a time")
+    parser.add_argument("--record-cache", default=None,
+                        help="JSON file caching the adjudicated tweets, so that only changed tweets are processed")
+    parser.add_argument("--alignment-cache", default=None,
+                        help="SQLite file memoizing the span alignments (fuzzy searches), also across runs")
+    parser.add_argument("--jsonl", action="store_true", help="stream the records to a JSONL file instead of a JSON one")
+    args = parser.parse_args()
+
     raw_q1 = _load(Q1_PATH, questionnaire=1)
     raw_q2 = _load(Q2_1_PATH, questionnaire=2) + _load(Q2_2_PATH, questionnaire=2)
 
@@ -166,152 +353,50 @@ if __name__ == "__main__":
     raw_q2 = sorted(raw_q2, key=lambda x: x["tweet"])
 
     tweets_with_emotion = set()
-    raw_q2_clean = []
     sentiment_tags = set()
     tot_with_emotion_count, tot_no_emotion_count = 0, 0
+    groups = []
     for tweet, group in groupby(raw_q2, lambda x: x["tweet"]):
         tot_with_emotion_count += 1
         tweet = " ".join(tweet.split())
         tweets_with_emotion.add(tweet)
 
-        group = list(group)
-
-        emotions = [x["emotion"] for x in group]
-        emotions_plutchik = [_emotion2plutchik[x["emotion"]][0] for x in group]
-        trusts = [x["trust"] for x in group]
-        # sentiments = [x["emotion_polarity"] for x in group]
-
-        emotions_plutchik_counts_class = Counter(emotions_plutchik)
-        emotions_plutchik_counts = dict(emotions_plutchik_counts_class.most_common())
-        # are there more then one category with the maximum?
-        _max_p = max(v for k, v in emotions_plutchik_counts.items())
-        if sum(1 for k, v in emotions_plutchik_counts.items() if v == _max_p) > 1:
-            continue  # cannot adjudicate an emotion (no unanimity)
-        # adjudicate using Plutchik emotion
-        emotion, _ = emotions_plutchik_counts_class.most_common(1)[0]
-
-        cues, tgts, stms, exps = [], [], [], []
-        polarities = []
-        for g in group:
-            if _emotion2plutchik[g["emotion"]][0] == emotion:
-                cue = g["span_supporting_emotion"]
-                tgt = g["target"]
-                stm = g["emotion_stimulus"]
-                exp = g["experiencer"]
-                polarity = g["emotion_polarity"]
-
-                if polarity.lower() not in blank_tags:
-                    polarities.append(polarity)
-                if cue.lower() not in blank_tags:
-                    cues.append(cue)
-                if tgt.lower() not in blank_tags:
-                    tgts.append(tgt)
-                if stm.lower() not in blank_tags:
-                    stms.append(stm)
-                if exp.lower() not in blank_tags:
-                    exps.append(exp)
-
-        sentiment_counts_class = Counter(polarities)
-        sentiment_counts = dict(sentiment_counts_class.most_common())
-        if len(sentiment_counts) == 0:
-            sentiment = _plutchik2sentiment[emotion]  # cannot adjudicate sentiment, must infer from emotion
-        else:
-            # are there more then one category with the maximum?
-            _max_p = max(v for k, v in sentiment_counts.items())
-            if sum(1 for k, v in sentiment_counts.items() if v == _max_p) > 1:
-                sentiment = _plutchik2sentiment[emotion]  # cannot adjudicate sentiment (no unanimity), must infer from emotion
-            else:
-                sentiment, _ = sentiment_counts_class.most_common(1)[0]
-                sentiment = _polaritytag2sentiment[sentiment]  # adjudicated sentiment (unanimity)
-
-
-        twitter_tokenizer = TweetTokenizer()
-
-        # Adjudicate cue spans
-        cues = [e for e in cues if e.strip().lower() not in tweeter_tags]
-        if len(cues) != 0:
-            cues_smart_split = []
-            for x in cues:
-                smart_split = split_longest_common_substrings(x, tweet, twitter_tokenizer.tokenize)
-                if smart_split is not None:
-                    cues_smart_split.append(smart_split)
-            try:
-                # cues_smart_split = [split_longest_common_substrings(x, tweet, twitter_tokenizer.tokenize) for x in cues]
-                cues = find_span_annotation_intersections(tweet, cues_smart_split, fuzzy=True,
-                                                          occurrences_adjudication=True, max_typos=5)
-            except:
-                warnings.warn(f"Unable to find cue spans {cues} in text '{tweet}'. Skipping...")
-                continue
+        groups.append((tweet, list(group)))
 
-        # Adjudicate target spans
-        if sum(1 for e in tgts if e.strip().lower() in tweeter_tags) > len(tgts) / 2:
-            tgts = [(-1, -1)]  # target is author
-        else:
-            tgts = [e for e in tgts if e.strip().lower() not in tweeter_tags]
-            if len(tgts) != 0:
-                tgts_smart_split = []
-                for x in tgts:
-                    smart_split = split_longest_common_substrings(x, tweet, twitter_tokenizer.tokenize)
-                    if smart_split is not None:
-                        tgts_smart_split.append(smart_split)
-                try:
-                    # tgts_smart_split = [split_longest_common_substrings(x, tweet, twitter_tokenizer.tokenize) for x in tgts]
-                    tgts = find_span_annotation_intersections(tweet, tgts_smart_split, fuzzy=True,
-                                                              occurrences_adjudication=True, max_typos=5)
-                except:
-                    warnings.warn(f"Unable to find target spans {tgts} in text '{tweet}'. Skipping...")
-                    continue
-
-        # Adjudicate stimulus spans
-        stms = [e for e in stms if e.strip().lower() not in tweeter_tags]
-        if len(stms) != 0:
-            stms_smart_split = []
-            for x in stms:
-                smart_split = split_longest_common_substrings(x, tweet, twitter_tokenizer.tokenize)
-                if smart_split is not None:
-                    stms_smart_split.append(smart_split)
-            try:
-                # stms_smart_split = [split_longest_common_substrings(x, tweet, twitter_tokenizer.tokenize) for x in stms]
-                stms = find_span_annotation_intersections(tweet, stms_smart_split, fuzzy=True,
-                                                          occurrences_adjudication=True, max_typos=5)
-            except:
-                warnings.warn(f"Unable to find stimulus spans {stms} in text '{tweet}'. Skipping...")
-                continue
+    # only the tweets whose annotations (or the conversion code) changed since the last run are adjudicated again
+    record_cache, keys = None, None
+    if args.record_cache is not None:
+        record_cache = RecordCache(args.record_cache, namespace=fingerprint_files([os.path.basename(__file__), "utils"]))
+        keys = [RecordCache.key(g) for g in groups]
+    todo = [i for i in range(len(groups)) if record_cache is None or keys[i] not in record_cache]
 
-        # Adjudicate experiencer spans
-        if sum(1 for e in exps if e.strip().lower() in tweeter_tags) > len(exps) / 2:
-            exps = [(-1, -1)]  # experiencer is author
-        else:
-            exps = [e for e in exps if e.strip().lower() not in tweeter_tags]
-            if len(exps) != 0:
-                exps_smart_split = []
-                for x in exps:
-                    smart_split = split_longest_common_substrings(x, tweet, twitter_tokenizer.tokenize)
-                    if smart_split is not None:
-                        exps_smart_split.append(smart_split)
-                try:
-                    # exps_smart_split = [split_longest_common_substrings(x, tweet, twitter_tokenizer.tokenize) for x in exps]
-                    exps = find_span_annotation_intersections(tweet, exps_smart_split, fuzzy=True,
-                                                              occurrences_adjudication=True, max_typos=5)
-                except:
-                    warnings.warn(f"Unable to find experiencer spans {exps} in text '{tweet}'. Skipping...")
-                    continue
-
-        # Merge contiguous spans that are separated by space, dash or other special chars
-        cues = merge_contiguous_spans(tweet, cues)
-        tgts = merge_contiguous_spans(tweet, tgts)
-        exps = merge_contiguous_spans(tweet, exps)
-        stms = merge_contiguous_spans(tweet, stms)
-
-        raw_q2_clean.append({
-            "text": tweet,
-            "emotion": emotion,
-            "sentiment": sentiment,
-            "cue": cues,
-            "target": tgts,
-            "experiencer": exps,
-            "stimulus": stms
-        })
+    if args.workers > 1:
+        # imap keeps the order of the groups, so that the ids (and the output file) are the same of a serial run
+        initializer = _open_aligner if args.alignment_cache is not None else None
+        with Pool(args.workers, initializer=initializer, initargs=(args.alignment_cache,)) as pool:
+            results = list(pool.imap(_adjudicate_tweet_star, [groups[i] for i in todo], chunksize=args.chunksize))
+    else:
+        if args.alignment_cache is not None:
+            _aligner = SpanAligner(args.alignment_cache)
+        results = [_adjudicate_tweet_star(groups[i]) for i in todo]
+    todo_adjudicated = [a for a, _, _ in results]
+    if args.alignment_cache is not None:
+        # the workers flushed their alignments to the same file: it is opened again for the statistics of all of them
+        _aligner = SpanAligner(args.alignment_cache) if _aligner is None else _aligner
+        _aligner.hits, _aligner.misses = sum(h for _, h, _ in results), sum(m for _, _, m in results)
+        print(f"alignment cache: {_aligner.info()}")
+        _aligner.close()
+
+    if record_cache is None:
+        adjudicated = todo_adjudicated
+    else:
+        adjudicated = [record_cache.get(k) if k in record_cache else None for k in keys]
+        for i, a in zip(todo, todo_adjudicated):
+            adjudicated[i] = a
+            record_cache.put(keys[i], a)
+        record_cache.save()
+        print(f"record cache: reused={record_cache.hits}, adjudicated={len(todo)}")
+    raw_q2_clean = [a for a in adjudicated if a is not None]
 
     # Clean Q1
     raw_q1_clean = []
@@ -332,7 +417,7 @@ if __name__ == "__main__":
         if count_noemotion / len(group) > 0.5:
             raw_q1_clean.append(tweet)
         tot_no_emotion_count += 1
-    result = {}
+    result = SRL4EWriter("SRL4E_elections.json", jsonl=args.jsonl)
     for index, data in enumerate(raw_q2_clean):
         index = "elections." + str(index).zfill(7)
         result[index] = {}
@@ -360,5 +445,4 @@ if __name__ == "__main__":
         result[index]["text"] = text
         result[index]["emotions"] = {}
 
-    with open("SRL4E_elections.json", "w") as f:
-        json.dump(result, f, sort_keys=True, indent=4)
\ No newline at end of file
+    result.close()
\ No newline at end of file
@@ -1,11 +1,11 @@
-import json
+import argparse
 import pandas as pd
-from utils import fuzzy_search, get_emoji_regexp_pattern
-import emoji
-import re
+from functools import lru_cache
+from utils import fuzzy_search, collapse_emoji_spaces
+from utils.srl4e import SRL4EWriter
+from utils.strings import SpanAligner
 
 EMOTWEET_PATH = "../datasets/emotweet/EmoTweet-28-v1.1/EmoTweet-28-v1.1.txt"
-EMOJI_REGEX_PATTERN = emoji.get_emoji_regexp('en').pattern
 
 # sorted(list(set(deep_flatten([[b.strip() for b in a[5].split(",")] for a in _load(...)]))))
 _emotion2plutchik = {
@@ -74,9 +74,11 @@ _emotion2sentiment = {
 
 _emotions = set(list(_emotion2plutchik.keys()))
 
+@lru_cache(maxsize=1 << 16)
 def remove_spaces_between_emojis(text):
-    f = lambda x: re.sub(EMOJI_REGEX_PATTERN + r"(\s+)" + EMOJI_REGEX_PATTERN, r"\g<1>\g<3>", x)
-    return f(f(text))
+    # same result of the previous double re.sub over emoji.get_emoji_regexp('en') (same emoji set), with a single scan
+    # of the text (see EmojiMatcher.collapse_emoji_spaces). Memoized, since the same cues appear in many tweets
+    return collapse_emoji_spaces(text)
 
 def _load(data_path):
     result = pd.read_csv(data_path).to_numpy().tolist()
@@ -100,9 +102,18 @@ def _load(data_path):
     return result
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--alignment-cache", default=None,
+                        help="SQLite file memoizing the cue alignments (fuzzy searches), also across runs")
+    parser.add_argument("--jsonl", action="store_true", help="stream the records to a JSONL file instead of a JSON one")
+    args = parser.parse_args()
+
+    aligner = SpanAligner(args.alignment_cache) if args.alignment_cache is not None else None
+    search = aligner.fuzzy_search if aligner is not None else fuzzy_search
+
     raw = _load(EMOTWEET_PATH)
 
-    result = {}
+    result = SRL4EWriter("SRL4E_emotweet.json", jsonl=args.jsonl)
 
     for index, data in enumerate(raw):
         index = "emotweet." + str(index).zfill(7)
@@ -154,7 +165,7 @@ if __name__ == "__main__":
                     #span = fuzzy_search(cue, text, max_typos=4)
                     #if span == None:
                         #span = fuzzy_search(remove_spaces_between_emojis(cue), text, max_typos=4)
-                    span = fuzzy_search(remove_spaces_between_emojis(cue), text, max_typos=4)
+                    span = search(remove_spaces_between_emojis(cue), text, max_typos=4)
                     assert span != None, f"cue='{cue}', emotions='{emotions}', text='{text}', index='{index}'"
                     # span = (pos, pos + len(cue))
                     cues_positions.append(span)
@@ -190,5 +201,7 @@ if __name__ == "__main__":
                 #result[index]["emotions"][emotion_index]["roles"]["experiencer"] = labels["experiencer"]
                 #result[index]["emotions"][emotion_index]["roles"]["target"] = labels["target"]
                 #result[index]["emotions"][emotion_index]["roles"]["cause"] = labels["cause"]
-    with open("SRL4E_emotweet.json", "w") as f:
-        json.dump(result, f, sort_keys=True, indent=4)
+    result.close()
+    if aligner is not None:
+        print(f"alignment cache: {aligner.info()}")
+        aligner.close()
@@ -0,0 +1,41 @@
+import argparse
+import json
+import numpy as np
+from utils.evaluation import SpanScorer, METRICS
+from utils.srl4e import load_srl4e
+
+
+def _f1(result, level, name, role, metric):
+    if level == "overall":
+        return result[level][role][metric]["f1"]
+    # emotions that only some prediction files predict (and the gold file does not have): no correct span in the others
+    return result[level][name][role][metric]["f1"] if name in result[level] else 0.0
+
+
+def _mean_std(results, level, name, role, metric):
+    f1 = [_f1(r, level, name, role, metric) for r in results]
+    return np.mean(f1), np.std(f1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Span-level evaluation of SRL4E predictions.")
+    parser.add_argument("gold", help="gold SRL4E file (json or jsonl)")
+    parser.add_argument("predictions", nargs="+", help="predicted SRL4E files (e.g. one for each seed)")
+    parser.add_argument("--level", choices=["overall", "dataset", "emotion"], default="overall")
+    parser.add_argument("--output", default=None, help="save all the scores of each prediction file to this json file")
+    args = parser.parse_args()
+
+    scorer = SpanScorer(load_srl4e(args.gold))
+    results = [scorer.score(load_srl4e(p)) for p in args.predictions]
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(dict(zip(args.predictions, results)), f, indent=4)
+
+    names = ["overall"] if args.level == "overall" else sorted({name for r in results for name in r[args.level]})
+    print(f"F1 (mean ± std over {len(results)} prediction files)")
+    print(" ".join(["name".ljust(16), "role".ljust(12)] + [m.ljust(16) for m in METRICS]))
+    for name in names:
+        for role in scorer.roles + ["all"]:
+            scores = [_mean_std(results, args.level, name, role, m) for m in METRICS]
+            print(" ".join([name.ljust(16), role.ljust(12)] +
+                           [f"{round(100 * m, 2)} ± {round(100 * s, 2)}".ljust(16) for m, s in scores]))
@@ -1,9 +1,11 @@
+import argparse
 import json
 import re
 import warnings
 #from unidecode import unidecode
 
 from utils.data import deep_flatten
+from utils.srl4e import SRL4EWriter
 
 news_titles_path = "../datasets/news_titles/goodnewseveryone-v1.0/gne-release-v1.0.jsonl"
 fixed_news_titles_path = "../datasets/news_titles/goodnewseveryone-v1.0/gne_fix.jsonl"
@@ -46,72 +48,81 @@ _orig2sentiment = {
     'trust': 'positive'
 }
 
-def search_span_deep_flatten(text, span):
-    flattened = deep_flatten(span)
-    if len(flattened) == 0:
-        return []  # todo: before it was (-1, -1)
-    else:
-        #assert len(flattened) == 1
-        #flattened = flattened[0]
-        #pos = text.find(flattened)
-        #return (pos, pos + len(flattened))
-        text = text.lower()
+_word_char = re.compile(r"\w")
+
+class SpanLocator:
+    '''
+    Locates the annotated spans of all the roles of a headline. The headline is lowercased only once, and each distinct
+    fragment is searched only once (the same fragment is often annotated for more than one role).
+    '''
+    def __init__(self, text):
+        self.text = text.lower()
+        self._spans = {}
+
+    def _find(self, fragment):
+        if fragment not in self._spans:
+            pos = self.text.find(fragment)
+            if pos == -1:
+                self._spans[fragment] = None
+            else:
+                end = pos + len(fragment)
+                # The original annotation presents a problem: sometimes the last character is missing from the spans,
+                # for example the annotated "Massive Resistanc" in the text is "Massive Resistance". Therefore, if the
+                # next character is a letter, the span is rounded up by only 1 character
+                self._spans[fragment] = (pos, end + 1) if _word_char.match(self.text, end) else (pos, end)
+        return self._spans[fragment]
+
+    def locate(self, span):
+        '''
+        :param span: GNE annotation (nested lists of strings, each one with "; " separated fragments)
+        :return: list of (begin, end) char spans of the fragments in the headline, skipping "none", "implicit" and the
+        fragments that cannot be found
+        '''
         result = []
-        for f in flattened:
-            f = f.lower().split("; ")
-            for _f in f:
+        for f in deep_flatten(span):
+            for _f in f.lower().split("; "):
                 if _f in ["none", "implicit"]:
                     continue
-                pos = text.find(_f)
-                if pos == -1:
-                    warnings.warn(f"Cannot find span in text: text='{text}', span='{span}'. Skipping...")
+                found = self._find(_f)
+                if found is None:
+                    warnings.warn(f"Cannot find span in text: text='{self.text}', span='{span}'. Skipping...")
                     continue
-                # The original annotation presents a problem: sometimes the last character is missing from the spans,
-                # for example the annotated "Massive Resistanc" in the text is "Massive Resistance". Therefore, if the
-                # next character is a letter, the span is rounded up by only 1 character
-                if len(text) > pos + len(_f) and re.search(r"\w", text[pos + len(_f)]):
-                    result.append((pos, pos + len(_f) + 1))
-                else:
-                    result.append((pos, pos + len(_f)))
+                result.append(found)
         return result
 
-if __name__ == "__main__":
-    raw, fix = [], []
-    fix_ids = {}
-    
-    # load the fixed dataset lines
-    with open(fixed_news_titles_path) as f:
-        counter = 0
-        for line in f:
-            l = json.loads(line)
-            fix_ids[l["id"]] = counter
-            fix.append(l)
-            counter += 1
-
-    # load the dataset and replaces lines that have been fixed (this will likely change with sth more elegant)
-    with open(news_titles_path) as f:
+def search_span_deep_flatten(text, span):
+    return SpanLocator(text).locate(span)
+
+def _load(data_path, fix_path):
+    '''
+    Streams the GNE records, replacing the ones that have been fixed.
+    :param data_path: path of the GNE release jsonl
+    :param fix_path: path of the jsonl with the fixed records (the last one wins if an id is repeated)
+    :return: generator of records, in the order of the release file
+    '''
+    # load the fixed dataset lines (a few records), indexed by id
+    with open(fix_path) as f:
+        fix = {l["id"]: l for l in map(json.loads, f)}
+    # stream the dataset, replacing lines that have been fixed
+    with open(data_path) as f:
         for line in f:
             l = json.loads(line)
-            if l["id"] in fix_ids:
-                l = fix[fix_ids[l["id"]]]
-            raw.append(l)
-    
-    
+            yield fix.get(l["id"], l)
 
-    id2class, class2id = {}, {}
-    for cl in _emotion_categs:
-        id2class[cl] = set()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jsonl", action="store_true", help="stream the records to a JSONL file instead of a JSON one")
+    args = parser.parse_args()
 
-        for e in raw:
-            for em in deep_flatten(e["annotations"][_label_emotion[cl]]["gold"]):
-                id2class[cl].add(em)
+    # class vocabularies of each emotion category, collected while converting
+    classes = {cl: set() for cl in _emotion_categs}
 
-        id2class[cl] = dict(list(enumerate(sorted(list(id2class[cl])))))
-        class2id[cl] = {v: k for k, v in id2class[cl].items()}
+    result = SRL4EWriter("SRL4E_gne.json", jsonl=args.jsonl)
 
-    result = {}
+    for index, data in enumerate(_load(news_titles_path, fixed_news_titles_path)):
+        for cl in _emotion_categs:
+            classes[cl].update(deep_flatten(data["annotations"][_label_emotion[cl]]["gold"]))
 
-    for index, data in enumerate(raw):
         index = "gne." + str(index).zfill(7)
         result[index] = {}
 
@@ -129,13 +140,18 @@ if __name__ == "__main__":
         #result[index]["emotions"][emotion_index]["intensity"] = None
         result[index]["emotions"][emotion_index]["roles"] = {}
 
-        result[index]["emotions"][emotion_index]["roles"]["cue"] = search_span_deep_flatten(text,
-            data["annotations"]["cue"]["gold"])
-        result[index]["emotions"][emotion_index]["roles"]["experiencer"] = search_span_deep_flatten(text,
+        locator = SpanLocator(text)
+        result[index]["emotions"][emotion_index]["roles"]["cue"] = locator.locate(data["annotations"]["cue"]["gold"])
+        result[index]["emotions"][emotion_index]["roles"]["experiencer"] = locator.locate(
             data["annotations"]["experiencer"]["gold"])
-        result[index]["emotions"][emotion_index]["roles"]["target"] = search_span_deep_flatten(text,
-            data["annotations"]["target"]["gold"])
-        result[index]["emotions"][emotion_index]["roles"]["cause"] = search_span_deep_flatten(text,
-            data["annotations"]["cause"]["gold"])
-    with open("SRL4E_gne.json", "w") as f:
-        json.dump(result, f, sort_keys=True, indent=4)
\ No newline at end of file
+        result[index]["emotions"][emotion_index]["roles"]["target"] = locator.locate(data["annotations"]["target"]["gold"])
+        result[index]["emotions"][emotion_index]["roles"]["cause"] = locator.locate(data["annotations"]["cause"]["gold"])
+    result.close()
+
+    # every class of the vocabularies must have a plutchik emotion and a sentiment (only the first dominant emotion of
+    # each headline is converted, so the others would go unnoticed)
+    for cl in _emotion_categs:
+        unmapped = sorted(c for c in classes[cl] if c not in _orig2plutchik or c not in _orig2sentiment)
+        if len(unmapped) > 0:
+            warnings.warn(f"The {cl} emotions {unmapped} have no plutchik emotion or sentiment")
+        print(f"{cl} emotions: {len(classes[cl])} classes")
@@ -1,12 +1,11 @@
-import json
+import argparse
 import warnings
 from collections import OrderedDict
 from itertools import groupby
 
 from utils import end_overlap
-import re
+from utils.srl4e import SRL4EWriter
 import xml.etree.ElementTree as ET
-import xmltodict
 
 class ContinueOuterLoop(Exception):
     pass
@@ -38,27 +37,101 @@ _emotion2sentiment = {
 _emotions = set(list(_emotion2plutchik.keys()))
 _nointerrupt_chars = {'#', '&', "'", '"', '(', ')', '-', '?', '[', '`', '±', '‘', '“', '”'}
 
-def _load(path):
-    #tree = ET.parse(path)
+_XML_BEGIN, _XML_END = "<?xml version", "</emotionml>"
+_XML_NAMESPACE = "http://www.w3.org/XML/1998/namespace"
+
+
+def _fix_line(line):
+    # the original files have some broken closing tags
+    return line.replace("?/text>", "</text>").replace("?/cause>", "</cause>")
+
+
+def _iter_documents(path):
+    '''
+    Streams the "<?xml ...>...</emotionml>" documents concatenated in a NTCIR file, fixing the broken closing tags on
+    the fly. Only the current document is kept in memory.
+    :param path: path of the NTCIR XML file
+    :return: generator of XML documents (strings)
+    '''
+    buffer = ""
     with open(path, "r") as f:
-        xmlstring = f.read()
-        xmlstring = xmlstring.replace("?/text>", "</text>")
-        xmlstring = xmlstring.replace("?/cause>", "</cause>")
-
-    data = []
-    for m in re.finditer(r"<\?xml version.*?<\/emotionml>", xmlstring, flags=re.DOTALL):
-        b, e = m.span()
-        match = xmlstring[b:e]
-        tree = ET.ElementTree(ET.fromstring(match))
-        #tree = ET.fromstring(re.sub(r"(<\?xml[^>]+\?>)", r"\1<root>", xml) + "</root>")
-
-        xml_data = tree.getroot()
-        xmlstr = ET.tostring(xml_data, encoding='utf-8', method='xml')
-        data_dict = dict(xmltodict.parse(xmlstr, strip_whitespace=False))
-        data.append(data_dict)
-    return data
-
-def _process_data(in_path, out_path, language):
+        for line in f:
+            buffer += _fix_line(line)
+            while True:
+                begin = buffer.find(_XML_BEGIN)
+                if begin == -1:
+                    buffer = buffer[-(len(_XML_BEGIN) - 1):]  # it may end with the beginning of _XML_BEGIN
+                    break
+                end = buffer.find(_XML_END, begin)
+                if end == -1:
+                    buffer = buffer[begin:]
+                    break
+                end += len(_XML_END)
+                yield buffer[begin:end]
+                buffer = buffer[end:]
+
+
+def _element_to_dict(root):
+    '''
+    Converts a parsed document to nested dicts, with the same structure that xmltodict.parse(..., strip_whitespace=False)
+    gives for the document serialized by ElementTree: namespaced names get ElementTree's "ns0", "ns1", ... prefixes
+    (declared with "@xmlns:nsX" attributes on the root), attributes are "@name" keys, text is "#text" (or the value
+    itself for elements with neither attributes nor children), repeated children become lists.
+    :param root: the root Element
+    :return: {root name: OrderedDict (or text, or None)}
+    '''
+    prefixes = {_XML_NAMESPACE: "xml"}
+    for elem in root.iter():
+        for name in [elem.tag] + list(elem.keys()):
+            if name[:1] == "{":
+                uri = name[1:].split("}", 1)[0]
+                if uri not in prefixes:
+                    prefixes[uri] = "ns%d" % (len(prefixes) - 1)
+
+    def _name(name):
+        if name[:1] == "{":
+            uri, local = name[1:].split("}", 1)
+            return prefixes[uri] + ":" + local
+        return name
+
+    def _push(item, key, value):
+        if key not in item:
+            item[key] = value
+        elif isinstance(item[key], list):
+            item[key].append(value)
+        else:
+            item[key] = [item[key], value]
+
+    def _convert(elem, is_root=False):
+        item = OrderedDict()
+        if is_root:
+            for uri, prefix in sorted(prefixes.items(), key=lambda x: x[1]):
+                if uri != _XML_NAMESPACE:
+                    item["@xmlns:" + prefix] = uri
+        for name, value in elem.items():
+            item["@" + _name(name)] = value
+        for child in elem:
+            _push(item, _name(child.tag), _convert(child))
+        data = (elem.text or "") + "".join(child.tail or "" for child in elem)
+        if len(item) == 0:
+            return data if data != "" else None
+        if data != "":
+            item["#text"] = data
+        return item
+
+    return {_name(root.tag): _convert(root, is_root=True)}
+
+
+def _load(path):
+    '''
+    Loads a NTCIR ECA file, parsing each of its emotionml documents only once.
+    :param path: path of the NTCIR XML file
+    :return: generator of dicts (see _element_to_dict), one per document
+    '''
+    for document in _iter_documents(path):
+        yield _element_to_dict(ET.fromstring(document))
+
+def _process_data(in_path, out_path, language, jsonl=False):
     assert language in ["english", "chinese"]
     raw = _load(in_path)
 
@@ -172,7 +245,7 @@ def _process_data(in_path, out_path, language):
             skipped += 1
             continue
 
-    result = {}
+    result = SRL4EWriter(out_path, jsonl=jsonl)
     raw_preprocessed = sorted(raw_preprocessed, key=lambda x: x["text"])
     for index, (key, group) in enumerate(groupby(raw_preprocessed, lambda x: x["text"])):
         group = list(group)
@@ -210,12 +283,15 @@ def _process_data(in_path, out_path, language):
     print(
         f"skipped={skipped}/{counter}={round(skipped / counter, 3)}, overlapping_cue={overlapping_cue}/{counter}={round(overlapping_cue / counter, 3)}")
 
-    with open(out_path, "w") as f:
-        json.dump(result, f, sort_keys=True, indent=4)
+    result.close()
 
 
 if __name__ == "__main__":
-    _process_data(in_path=NTCIR_TRAIN_EN_PATH, out_path="SRL4E_ntcir_en_train.json", language="english")
-    _process_data(in_path=NTCIR_TEST_EN_PATH, out_path="SRL4E_ntcir_en_test.json", language="english")
-    _process_data(in_path=NTCIR_TRAIN_CH_PATH, out_path="SRL4E_ntcir_ch_train.json", language="chinese")
-    _process_data(in_path=NTCIR_TEST_CH_PATH, out_path="SRL4E_ntcir_ch_test.json", language="chinese")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jsonl", action="store_true", help="stream the records to a JSONL file instead of a JSON one")
+    args = parser.parse_args()
+
+    _process_data(in_path=NTCIR_TRAIN_EN_PATH, out_path="SRL4E_ntcir_en_train.json", language="english", jsonl=args.jsonl)
+    _process_data(in_path=NTCIR_TEST_EN_PATH, out_path="SRL4E_ntcir_en_test.json", language="english", jsonl=args.jsonl)
+    _process_data(in_path=NTCIR_TRAIN_CH_PATH, out_path="SRL4E_ntcir_ch_train.json", language="chinese", jsonl=args.jsonl)
+    _process_data(in_path=NTCIR_TEST_CH_PATH, out_path="SRL4E_ntcir_ch_test.json", language="chinese", jsonl=args.jsonl)
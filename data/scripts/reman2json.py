@@ -1,7 +1,10 @@
-import json
+import argparse
 import warnings
+import xml.etree.ElementTree as ET
 import xmlschema
-from nltk.tokenize import sent_tokenize
+from xmlschema.validators import XsdElement, XsdAtomicBuiltin
+from utils.tokenizers import get_tokenizer
+from utils.srl4e import SRL4EWriter
 
 class ContinueOuterLoop(Exception):
     pass
@@ -34,16 +37,103 @@ _emotion2plutchik = {
     'disgust': 'disgust'
 }
 
-def _load(schema, data):
-    schema = xmlschema.XMLSchema(schema)
-    reman = schema.to_dict(data)
-    return reman
+def _decoding_rules(xsd):
+    '''
+    Reads from the schema how xmlschema.XMLSchema.to_dict decodes the elements and attributes: an element is a list
+    (even when it appears only once) if it or the content group of its parent can occur more than once (e.g.
+    maxOccurs="unbounded"), and an attribute is an int if its type is (derived from) an integer type.
+    :param xsd: xmlschema.XMLSchema
+    :return: (set of the names of the list elements, set of the names of the int attributes)
+    '''
+    list_elements, int_attributes = set(), set()
+    for component in xsd.iter_components():
+        if not isinstance(component, XsdElement):
+            continue
+        for name, attribute in component.attributes.items():
+            attribute_type = attribute.type
+            while not isinstance(attribute_type, XsdAtomicBuiltin) and attribute_type.base_type is not None:
+                attribute_type = attribute_type.base_type
+            if getattr(attribute_type, "python_type", None) is int:
+                int_attributes.add(attribute.local_name)
+        if component.type.is_simple() or component.type.simple_type is not None:
+            continue
+        content = component.type.content
+        for child in content.iter_elements():
+            if not (content.is_single() and child.is_single()):
+                list_elements.add(child.local_name)
+    return list_elements, int_attributes
+
+def _element_to_dict(elem, list_elements, int_attributes):
+    '''
+    Converts an element as xmlschema.XMLSchema.to_dict does: attributes become "@<name>" keys, the text of elements
+    with attributes becomes "$", the text of the other elements becomes their value, and empty elements become None.
+    :param elem: ElementTree element
+    :param list_elements: names of the elements decoded as lists, see _decoding_rules
+    :param int_attributes: names of the attributes decoded as ints, see _decoding_rules
+    :return: the decoded element
+    '''
+    result = {"@" + k: int(v) if k in int_attributes else v for k, v in elem.attrib.items()}
+    for child in elem:
+        value = _element_to_dict(child, list_elements, int_attributes)
+        if child.tag in list_elements:
+            result.setdefault(child.tag, []).append(value)
+        else:
+            result[child.tag] = value
+    text = elem.text.strip() if elem.text is not None and len(elem) == 0 else ""
+    if len(result) == 0:
+        return elem.text if text != "" else None
+    if text != "":
+        result["$"] = elem.text
+    return result
+
+def _load(data, schema, validate=False):
+    '''
+    Streams the REMAN documents one at a time, with the same shape of xmlschema.XMLSchema(schema).to_dict(data)["document"]
+    items, without building the whole tree: each document is dropped once decoded.
+    Without *validate*, the documents are not validated: they are converted by _element_to_dict, with the list elements
+    and int attributes read from the schema, and the first one is checked against the schema decoding.
+    :param data: path of the REMAN xml
+    :param schema: path of the REMAN xsd
+    :param validate: if True, each document is validated and decoded with the schema (slower)
+    :return: generator of documents (dicts)
+    '''
+    xsd = xmlschema.XMLSchema(schema)
+    rules = _decoding_rules(xsd)
+    document_xsd, root, depth, checked = None, None, 0, False
+    for event, elem in ET.iterparse(data, events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if root is None:
+                root = elem
+                document_xsd = xsd.find(root.tag + "/document")
+            continue
+        depth -= 1
+        if depth == 1 and elem.tag == "document":
+            if validate:
+                yield document_xsd.decode(elem)
+            else:
+                document = _element_to_dict(elem, *rules)
+                if not checked:
+                    assert document == document_xsd.decode(elem), \
+                        f"The REMAN documents are not decoded as {schema} does, use --validate"
+                    checked = True
+                yield document
+            # the parser may already have attached the next documents to root, so only this one is dropped
+            root.remove(elem)
 
 if __name__ == "__main__":
-    raw = _load(REMAN_SCHEMA_PATH, REMAN_PATH)["document"]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--jsonl", action="store_true", help="stream the records to a JSONL file instead of a JSON one")
+    parser.add_argument("--validate", action="store_true",
+                        help="validate each document against the REMAN schema (by default the documents are not "
+                             "validated: the schema is only read to decode them)")
+    args = parser.parse_args()
+
+    raw = _load(REMAN_PATH, REMAN_SCHEMA_PATH, validate=args.validate)
 
     skipped_counter = 0
-    result = {}
+    sentence_tokenizer = get_tokenizer("sentence")  # Punkt is loaded only once (sent_tokenize loads it at each call)
+    result = SRL4EWriter("SRL4E_reman.json", jsonl=args.jsonl)
 
     for index, data in enumerate(raw):
         index = "reman." + str(index).zfill(7)
@@ -54,7 +144,7 @@ if __name__ == "__main__":
             result[index]["text"] = text
             result[index]["emotions"] = {}
 
-            text_spl = sent_tokenize(text)
+            text_spl = sentence_tokenizer.tokenize(text)
             assert len(text_spl) == 3, "Cannot split " + index + f": text='{text}'"
             text_left, text_main, text_right = tuple(text_spl)
 
@@ -146,5 +236,4 @@ if __name__ == "__main__":
             del result[index]
             skipped_counter += 1
             continue
-    with open("SRL4E_reman.json", "w") as f:
-        json.dump(result, f, sort_keys=True, indent=4)
\ No newline at end of file
+    result.close()
\ No newline at end of file
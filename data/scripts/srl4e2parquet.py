@@ -0,0 +1,99 @@
+import argparse
+import glob
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+from utils.srl4e import iter_srl4e
+
+ROLES = ["cue", "experiencer", "target", "cause"]
+_span_type = pa.list_(pa.struct([("begin", pa.int32()), ("end", pa.int32())]))
+SCHEMA = pa.schema(
+    [
+        ("dataset", pa.string()),
+        ("text_id", pa.string()),
+        ("emotion_id", pa.string()),
+        ("text", pa.string()),
+        ("original_emotion", pa.list_(pa.string())),
+        ("plutchik_emotion", pa.list_(pa.string())),
+        ("sentiment", pa.string())
+    ] + [(role, _span_type) for role in ROLES]
+)
+
+
+def _as_list(labels):
+    # emotions are stored either as a label or as a list of labels, depending on the dataset
+    if labels is None:
+        return None
+    return [labels] if isinstance(labels, str) else list(labels)
+
+
+def _rows(records, dataset):
+    '''
+    Flattens SRL4E records to one row per emotion. Records without emotions get a single row with null emotion
+    columns, so that the texts can still be counted.
+    :param records: iterable of (index, record) tuples, see utils.srl4e.iter_srl4e
+    :param dataset: dataset name (e.g. "gne")
+    :return: generator of dicts, with the columns of SCHEMA
+    '''
+    for index, record in records:
+        emotions = record["emotions"].items() if len(record["emotions"]) > 0 else [(None, None)]
+        for emotion_index, emotion in emotions:
+            row = {"dataset": dataset, "text_id": index, "emotion_id": emotion_index, "text": record["text"]}
+            emotion = emotion if emotion is not None else {"roles": {}}
+            row["original_emotion"] = _as_list(emotion.get("original_emotion"))
+            row["plutchik_emotion"] = _as_list(emotion.get("plutchik_emotion"))
+            row["sentiment"] = emotion.get("sentiment")
+            for role in ROLES:
+                spans = emotion["roles"].get(role)
+                row[role] = [{"begin": b, "end": e} for b, e in spans] if spans is not None else None
+            yield row
+
+
+def to_table(records, dataset, batch_size=1 << 14):
+    '''
+    :param records: iterable of (index, record) tuples, see utils.srl4e.iter_srl4e
+    :param dataset: dataset name (e.g. "gne")
+    :param batch_size: rows converted at a time, so that only the arrow table (and not a list of rows) is in memory
+    :return: pyarrow.Table with SCHEMA, one row per emotion
+    '''
+    batches, rows = [], []
+    for row in _rows(records, dataset):
+        rows.append(row)
+        if len(rows) == batch_size:
+            batches.append(pa.RecordBatch.from_pylist(rows, schema=SCHEMA))
+            rows = []
+    if len(rows) > 0 or len(batches) == 0:
+        batches.append(pa.RecordBatch.from_pylist(rows, schema=SCHEMA))
+    return pa.Table.from_batches(batches, schema=SCHEMA)
+
+
+def export(paths, output_path, partition_cols=("dataset",)):
+    '''
+    Writes the SRL4E files to a Parquet dataset, partitioned by *partition_cols* (e.g. <output_path>/dataset=gne/...).
+    The files are converted one at a time.
+    :param paths: list of SRL4E_*.json or SRL4E_*.jsonl paths
+    :param output_path: root directory of the Parquet dataset
+    :param partition_cols: columns used to partition the dataset
+    :return: dict dataset -> amount of written rows
+    '''
+    counts = {}
+    for path in paths:
+        dataset = os.path.splitext(os.path.basename(path))[0][len("SRL4E_"):]
+        table = to_table(iter_srl4e(path), dataset)
+        # fixed file names: exporting a dataset again overwrites its files instead of adding new ones
+        pq.write_to_dataset(table, output_path, partition_cols=list(partition_cols),
+                            basename_template=dataset + "-{i}.parquet", existing_data_behavior="overwrite_or_ignore")
+        counts[dataset] = counts.get(dataset, 0) + table.num_rows
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exports the SRL4E files to a Parquet dataset, one row per emotion.")
+    parser.add_argument("paths", nargs="*", help="SRL4E files to export (default: all the SRL4E_*.json files)")
+    parser.add_argument("-o", "--output", default="SRL4E_parquet", help="root directory of the Parquet dataset")
+    parser.add_argument("--partition", nargs="+", default=["dataset"], help="partitioning columns")
+    args = parser.parse_args()
+
+    paths = args.paths if len(args.paths) > 0 else sorted(glob.glob("SRL4E_*.json"))
+    for dataset, count in export(paths, args.output, partition_cols=args.partition).items():
+        print(f"{dataset}: {count} rows")
@@ -0,0 +1,65 @@
+import numpy as np
+from utils.data import bucket_batches, BucketBatchSampler, DynamicBatchCollator, srl4e_samples, build_vocabulary, \
+    PAD_ID, UNK_ID
+from utils.tokens import TokenIndex
+
+
+def _check_batches(batches, lengths, max_tokens=None, batch_size=None):
+    # every sample appears exactly once
+    assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+    for batch in batches:
+        assert len(batch) > 0
+        if batch_size is not None:
+            assert len(batch) <= batch_size
+        # the token budget is respected, except for a sample that is longer than the budget on its own
+        if max_tokens is not None and len(batch) > 1:
+            assert len(batch) * max(lengths[i] for i in batch) <= max_tokens
+
+
+def test_bucket_batches():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        lengths = rng.integers(1, 120, size=rng.integers(1, 500))
+        for shuffle in [True, False]:
+            _check_batches(bucket_batches(lengths, max_tokens=256, bucket_size=5, shuffle=shuffle, seed=1), lengths,
+                           max_tokens=256)
+            _check_batches(bucket_batches(lengths, batch_size=7, bucket_size=5, shuffle=shuffle, seed=1), lengths,
+                           batch_size=7)
+
+
+def test_bucket_batches_empty():
+    assert bucket_batches(np.array([], dtype=int), max_tokens=100) == []
+    assert bucket_batches([], batch_size=8) == []
+    assert list(BucketBatchSampler([], max_tokens=100)) == []
+
+
+def test_bucket_batch_sampler():
+    lengths = np.random.default_rng(0).integers(1, 50, size=300)
+    sampler = BucketBatchSampler(lengths, max_tokens=200, bucket_size=10, seed=0)
+    epochs = [list(sampler) for _ in range(3)]
+    for batches in epochs:
+        _check_batches(batches, lengths, max_tokens=200)
+    # reshuffled at each epoch
+    assert epochs[0] != epochs[1]
+
+
+def test_srl4e_samples():
+    records = [
+        ("gne.0000000", {"text": "I love pizza", "emotions": {"gne.0000000.00": {"roles": {"cue": [[2, 6]],
+                                                                                           "target": [[7, 12]]}}}}),
+        ("gne.0000001", {"text": "pizza again !", "emotions": {"gne.0000001.00": {"roles": {"cue": [[12, 13]]}}}})
+    ]
+    index = TokenIndex.from_records(records)
+    texts = [record["text"] for _, record in records]
+    vocabulary = build_vocabulary(index, texts)
+    assert vocabulary["<pad>"] == PAD_ID and vocabulary["<unk>"] == UNK_ID and vocabulary["pizza"] == 2
+    samples = srl4e_samples(index, texts, vocabulary)
+    assert [s["text"].tolist() for s in samples] == [[vocabulary[t] for t in ["I", "love", "pizza"]],
+                                                     [vocabulary[t] for t in ["pizza", "again", "!"]]]
+    assert srl4e_samples(index, texts, {"<pad>": PAD_ID, "<unk>": UNK_ID})[0]["text"].tolist() == [UNK_ID] * 3
+
+    collator = DynamicBatchCollator(as_tensors=False)
+    batches = list(collator.timed([collator(samples)]))
+    assert batches[0]["text"].shape == (2, 3) and batches[0]["lengths"].tolist() == [3, 3]
+    stats = collator.stats()
+    assert stats["batches"] == 1 and stats["padding_ratio"] == 0.0 and stats["max_step_ms"] >= stats["max_wait_ms"]
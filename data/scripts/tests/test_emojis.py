@@ -0,0 +1,35 @@
+import random
+import re
+from utils.emojis import collapse_emoji_spaces, get_emoji_regexp_pattern, _load_tables
+
+
+def test_collapse_emoji_spaces():
+    assert collapse_emoji_spaces("so funny \U0001f602 \U0001f602  \U0001f602 !") == "so funny \U0001f602\U0001f602\U0001f602 !"
+    assert collapse_emoji_spaces("no emojis here") == "no emojis here"
+
+
+def test_collapse_emoji_spaces_overlapping_flags():
+    # 🇦🇸 🇮 is scanned as a flag and a single regional indicator, but 🇸🇮 is a flag too: the substitution of the previous
+    # implementation matched 🇸🇮, followed by a space and 🇵🇳
+    text = "\U0001f1e6\U0001f1f8\U0001f1ee \U0001f1f5\U0001f1f3"
+    assert collapse_emoji_spaces(text) == "\U0001f1e6\U0001f1f8\U0001f1ee\U0001f1f5\U0001f1f3"
+
+
+def test_collapse_emoji_spaces_joined_emojis():
+    # the first substitution joins 👍 and 🏻 (a skin tone), that the second one matches as a single emoji 👍🏻
+    assert collapse_emoji_spaces("\U0001f44d \U0001f3fb \U0001f600") == "\U0001f44d\U0001f3fb\U0001f600"
+
+
+def test_collapse_emoji_spaces_random():
+    # previous implementation: emoji-whitespaces-emoji substituted twice with the sorted alternation of all the emojis
+    pattern = re.compile(get_emoji_regexp_pattern() + r"(\s+)" + get_emoji_regexp_pattern())
+    f = lambda x: pattern.sub(r"\g<1>\g<3>", x)
+    emojis = sorted(_load_tables()["EMOJI_UNICODE_ENGLISH"].values())
+    rng = random.Random(0)
+    for _ in range(3000):
+        chars = []
+        for _ in range(rng.randint(1, 5)):
+            # emojis, also split in their characters, and other text
+            chars += list(rng.choice(emojis)) if rng.random() < 0.5 else [rng.choice(emojis), rng.choice("ab#1!")]
+        text = "".join(c + rng.choice(["", "", " ", "  ", "\t"]) for c in chars)
+        assert collapse_emoji_spaces(text) == f(f(text)), text
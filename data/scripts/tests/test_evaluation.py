@@ -0,0 +1,34 @@
+from utils.evaluation import SpanScorer
+
+GOLD = {
+    "gne.0000000": {"text": "I love pizza but I hate rain", "emotions": {
+        "gne.0000000.00": {"plutchik_emotion": "joy", "roles": {"cue": [[2, 6]], "target": [[7, 12]]}}}},
+    "gne.0000001": {"text": "The storm scared everyone", "emotions": {
+        "gne.0000001.00": {"plutchik_emotion": "fear", "roles": {"cue": [[10, 16]]}}}}
+}
+# the first file has a "sadness" emotion that is not in the gold file, the second one an "anger" one with the same id
+PREDICTIONS = [
+    {
+        "gne.0000000": {"text": GOLD["gne.0000000"]["text"], "emotions": {
+            "gne.0000000.00": {"plutchik_emotion": "joy", "roles": {"cue": [[2, 6]], "target": [[7, 10]]}},
+            "gne.0000000.01": {"plutchik_emotion": "sadness", "roles": {"cue": [[19, 23]]}}}},
+        "gne.0000001": {"text": GOLD["gne.0000001"]["text"], "emotions": {}}
+    },
+    {
+        "gne.0000000": {"text": GOLD["gne.0000000"]["text"], "emotions": {
+            "gne.0000000.01": {"plutchik_emotion": "anger", "roles": {"cue": [[19, 23]], "target": [[24, 28]]}}}},
+        "gne.0000001": {"text": GOLD["gne.0000001"]["text"], "emotions": {
+            "gne.0000001.00": {"plutchik_emotion": "fear", "roles": {"cue": [[10, 16]]}}}}
+    }
+]
+
+
+def test_score_has_no_side_effects():
+    scorer = SpanScorer(GOLD)
+    reused = [scorer.score(p) for p in PREDICTIONS]
+    fresh = [SpanScorer(GOLD).score(p) for p in PREDICTIONS]
+    assert reused == fresh
+    assert sorted(reused[0]["emotion"]) == ["fear", "joy", "sadness"]
+    assert sorted(reused[1]["emotion"]) == ["anger", "fear", "joy"]
+    # the second file is scored the same after the first one
+    assert scorer.score(PREDICTIONS[1]) == reused[1]
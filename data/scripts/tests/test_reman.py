@@ -0,0 +1,26 @@
+import os
+import xml.etree.ElementTree as ET
+import xmlschema
+from reman2json import _decoding_rules, _element_to_dict, _load
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), "data", "reman-sample.xsd")
+DATA_PATH = os.path.join(os.path.dirname(__file__), "data", "reman-sample.xml")
+
+
+def test_decoding_rules():
+    assert _decoding_rules(xmlschema.XMLSchema(SCHEMA_PATH)) == ({"document", "span", "relation"}, {"cbegin", "cend"})
+
+
+def test_element_to_dict_matches_schema_decoding():
+    xsd = xmlschema.XMLSchema(SCHEMA_PATH)
+    rules = _decoding_rules(xsd)
+    documents = ET.parse(DATA_PATH).getroot().findall("document")
+    assert len(documents) > 0
+    for document in documents:
+        assert _element_to_dict(document, *rules) == xsd.find("corpus/document").decode(document)
+
+
+def test_load_matches_to_dict():
+    reference = xmlschema.XMLSchema(SCHEMA_PATH).to_dict(DATA_PATH)["document"]
+    assert list(_load(DATA_PATH, SCHEMA_PATH)) == reference
+    assert list(_load(DATA_PATH, SCHEMA_PATH, validate=True)) == reference
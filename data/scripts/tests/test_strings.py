@@ -0,0 +1,110 @@
+import random
+from utils.strings import range_intersections, fuzzy_search, SpanAligner
+
+
+def _range_intersections_reference(a, b):
+    # previous nested-comprehension implementation (find_span_annotation_intersections._range_intersections)
+    return [(max(first[0], second[0]), min(first[1], second[1]))
+            for first in a for second in b
+            if max(first[0], second[0]) <= min(first[1], second[1])]
+
+
+def _random_ranges(rng, n, length):
+    ranges = []
+    for _ in range(n):
+        begin = rng.randint(0, length)
+        ranges.append((begin, begin + rng.choice([0, 0, 1, rng.randint(0, length)])))
+    return ranges
+
+
+def test_range_intersections_cases():
+    # touching, zero-length, nested and empty inputs
+    cases = [
+        ([(2, 5)], [(5, 8)]),
+        ([(3, 3)], [(3, 3)]),
+        ([(3, 3)], [(0, 10)]),
+        ([(0, 10)], [(2, 4), (4, 6), (9, 10), (10, 12)]),
+        ([(0, 10), (2, 3)], [(1, 9), (2, 3)]),
+        ([], [(1, 2)]),
+        ([(1, 2)], []),
+        ([], [])
+    ]
+    for a, b in cases:
+        assert range_intersections(a, b) == _range_intersections_reference(a, b)
+    assert range_intersections([(2, 5)], [(5, 8)]) == [(5, 5)]
+
+
+def test_range_intersections_random():
+    rng = random.Random(0)
+    for _ in range(5000):
+        length = rng.randint(0, 30)
+        a = _random_ranges(rng, rng.randint(0, 8), length)
+        b = _random_ranges(rng, rng.randint(0, 8), length)
+        if rng.random() < 0.2:
+            b = b + rng.sample(a, min(len(a), 2))  # identical ranges
+        assert range_intersections(a, b) == _range_intersections_reference(a, b)
+
+
+def test_fuzzy_search_engines_cases():
+    # ties (several spans with the minimum amount of typos), no match, empty strings, case folding
+    cases = [
+        ("ab", "xaxbx", 1), ("abc", "abxabc", 2), ("aab", "ab ab aab", 1), ("obama", "I love Obbama!", 1),
+        ("xyz", "abcdef", 1), ("", "abc", 1), ("abc", "", 2), ("abc", "", 5), ("straße", "STRASSE strasse", 2),
+        ("ſs", "SS", 0), ("σς", "ΣΣ", 0), ("KELVIN", "\u212aelvin", 0), ("İi", "iI ıI İi", 1), ("ab", "abab", None)
+    ]
+    for sub, text, max_typos in cases:
+        for ignore_case in [True, False]:
+            assert fuzzy_search(sub, text, max_typos=max_typos, ignore_case=ignore_case, engine="edlib") == \
+                fuzzy_search(sub, text, max_typos=max_typos, ignore_case=ignore_case, engine="regex"), (sub, text)
+
+
+def test_fuzzy_search_engines_random():
+    # the edlib engine returns the same span of the regex BESTMATCH search, ties included
+    rng = random.Random(0)
+    for alphabet in ["ab ", "abcAB ", "aAbBİiıIßsſSKk\u212aσςΣé😀 "]:
+        for _ in range(3000):
+            text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+            sub = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 8)))
+            max_typos, ignore_case = rng.choice([0, 1, 2, 3, 5, None]), rng.random() < 0.7
+            assert fuzzy_search(sub, text, max_typos=max_typos, ignore_case=ignore_case, engine="edlib") == \
+                fuzzy_search(sub, text, max_typos=max_typos, ignore_case=ignore_case, engine="regex"), (sub, text)
+
+
+def test_span_aligner_persisted_hits(tmp_path):
+    path = str(tmp_path / "alignments.sqlite")
+    with SpanAligner(path) as aligner:
+        assert aligner.fuzzy_search("obama", "I love Obbama", max_typos=1) == (7, 13)
+        assert aligner.split_longest_common_substrings("I love obama", "I really love Obama") == ["I", "love Obama"]
+        assert (aligner.hits, aligner.misses) == (0, 2)
+    with SpanAligner(path) as aligner:
+        # served from the SQLite file, and returned as tuples again after the JSON round trip
+        span = aligner.fuzzy_search("obama", "I love Obbama", max_typos=1)
+        assert span == (7, 13) and isinstance(span, tuple)
+        assert aligner.split_longest_common_substrings("I love obama", "I really love Obama") == ["I", "love Obama"]
+        assert aligner.fuzzy_search("trump", "I love Obbama", max_typos=1) is None
+        assert aligner.fuzzy_search("trump", "I love Obbama", max_typos=1) is None
+        assert (aligner.hits, aligner.misses) == (3, 1)
+        assert aligner.info().size == 3
+
+
+def test_span_aligner_tuples(tmp_path):
+    with SpanAligner(str(tmp_path / "alignments.sqlite"), flush_every=1) as aligner:
+        # flush_every=1: the second search reads the JSON list stored by the first one
+        assert isinstance(aligner.fuzzy_search("obama", "I love Obama", max_typos=1), tuple)
+        span = aligner.fuzzy_search("obama", "I love Obama", max_typos=1)
+        assert span == fuzzy_search("obama", "I love Obama", max_typos=1) == (7, 12) and isinstance(span, tuple)
+        assert aligner.hits == 1
+
+
+def test_span_aligner_namespace_change(tmp_path):
+    path = str(tmp_path / "alignments.sqlite")
+    with SpanAligner(path, namespace="v1") as aligner:
+        aligner.fuzzy_search("obama", "I love Obama", max_typos=1)
+    with SpanAligner(path, namespace="v1") as aligner:
+        assert aligner.info().size == 1
+    with SpanAligner(path, namespace="v2") as aligner:
+        assert aligner.info().size == 0
+        aligner.fuzzy_search("obama", "I love Obama", max_typos=1)
+        assert (aligner.hits, aligner.misses) == (0, 1)
+    with SpanAligner(path, namespace="v1") as aligner:
+        assert aligner.info().size == 0
@@ -1,3 +1,4 @@
 from utils.data import pad_batch_collator, deep_flatten
-from utils.strings import fuzzy_search, find_span_annotation_intersections, split_longest_common_substrings, merge_contiguous_spans, end_overlap
-from utils.emojis import get_emoji_regexp_pattern
\ No newline at end of file
+from utils.strings import fuzzy_search, find_span_annotation_intersections, split_longest_common_substrings, merge_contiguous_spans, end_overlap, TextTokenIndex
+from utils.emojis import get_emoji_regexp_pattern, find_emojis, collapse_emoji_spaces
+from utils.tokenizers import get_tokenizer
\ No newline at end of file
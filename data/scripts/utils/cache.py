@@ -0,0 +1,151 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict, namedtuple
+
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "evictions", "size", "maxsize"])
+
+
+class LRUCache:
+    '''
+    Bounded least-recently-used cache with hit/miss/eviction counters.
+    E.g. cache = LRUCache(maxsize=2); cache.put("a", 1); cache.get("a") returns 1 and counts a hit.
+    '''
+    def __init__(self, maxsize=4096):
+        '''
+        :param maxsize: maximum amount of entries. If None, the cache is unbounded and nothing is ever evicted.
+        '''
+        assert maxsize is None or maxsize > 0, "maxsize must be None or a positive int"
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self.hits, self.misses, self.evictions = 0, 0, 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        '''
+        Returns the value cached for *key* (marking it as most recently used) or *default* if missing.
+        :param key: the (hashable) key
+        :param default: value returned when *key* is not cached
+        :return: the cached value or *default*
+        '''
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        '''
+        Caches *value* for *key*, evicting the least recently used entry if the cache is full.
+        :param key: the (hashable) key
+        :param value: the value to cache
+        '''
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if self.maxsize is not None and len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        '''
+        Empties the cache and resets its counters.
+        '''
+        self._data.clear()
+        self.hits, self.misses, self.evictions = 0, 0, 0
+
+    def info(self):
+        '''
+        :return: a CacheInfo(hits, misses, evictions, size, maxsize) namedtuple
+        '''
+        return CacheInfo(self.hits, self.misses, self.evictions, len(self._data), self.maxsize)
+
+
+def fingerprint_files(paths, root="."):
+    '''
+    Content-addressed fingerprint of a set of files (directories are walked recursively, skipping __pycache__).
+    Missing files are part of the fingerprint too, so that creating them changes it.
+    :param paths: list of file or directory paths, relative to *root*
+    :param root: directory the paths are relative to. Only the relative paths are hashed, so moving *root* somewhere
+    else does not change the fingerprint
+    :return: sha256 hex digest of the paths and their content
+    '''
+    files = []
+    for path in paths:
+        if os.path.isdir(os.path.join(root, path)):
+            for dir_path, dirs, names in os.walk(os.path.join(root, path)):
+                dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+                files += [os.path.relpath(os.path.join(dir_path, n), root) for n in sorted(names)]
+        else:
+            files.append(path)
+    h = hashlib.sha256()
+    for path in files:
+        h.update(os.path.normpath(path).encode("utf-8") + b"\0")
+        if os.path.isfile(os.path.join(root, path)):
+            with open(os.path.join(root, path), "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+        else:
+            h.update(b"<missing>")
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class RecordCache:
+    '''
+    Persistent (JSON file) cache of converted records, keyed by the hash of their raw content. All the entries are
+    invalidated when *namespace* (e.g. the fingerprint of the conversion code) changes. Values must be JSON
+    serializable: tuples are read back as lists, which is fine for SRL4E spans since they are dumped as lists anyway.
+    '''
+    def __init__(self, path, namespace):
+        '''
+        :param path: path of the JSON file where the cache is stored
+        :param namespace: cache version. If it differs from the stored one, the stored entries are discarded
+        '''
+        self.path, self.namespace = path, namespace
+        self._records, self._used = {}, {}
+        self.hits, self.misses = 0, 0
+        if os.path.isfile(path):
+            with open(path) as f:
+                stored = json.load(f)
+            if stored.get("namespace") == namespace:
+                self._records = stored["records"]
+
+    @staticmethod
+    def key(raw_record):
+        '''
+        :param raw_record: JSON serializable raw record (non serializable values are converted with str)
+        :return: sha256 hex digest of the record content
+        '''
+        return hashlib.sha256(json.dumps(raw_record, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def __contains__(self, key):
+        return key in self._records
+
+    def get(self, key, default=None):
+        if key in self._records:
+            self.hits += 1
+            self._used[key] = self._records[key]
+            return self._records[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self._records[key] = value
+        self._used[key] = value
+
+    def save(self):
+        '''
+        Writes the cache to disk. Only the entries read or written since loading are kept, so that records that
+        disappeared from the raw data do not accumulate.
+        '''
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump({"namespace": self.namespace, "records": self._used}, f)
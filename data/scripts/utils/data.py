@@ -1,15 +1,298 @@
+import time
+import numpy as np
+
+
 def deep_flatten(element_or_list):
     '''
     Deeply flattens input list composed of nested lists.
     E.g. if element=[1,[[[2],[2.5,[2.6]]]],[[3],[4,5,[6,[[[[7]]]]]]]], output=[1, 2, 2.5, 2.6, 3, 4, 5, 6, 7]
+    Lists without nested lists (the most frequent case) are just copied. Otherwise an explicit stack of iterators is
+    used instead of recursive generators.
     :param element: list to flatten
     :return: flattened list
     '''
-    def _iter_all_generator(elem):
-        if isinstance(elem, list):
-            for el in elem:
-                yield from _iter_all_generator(el)
+    if not isinstance(element_or_list, list):
+        return [element_or_list]
+    for e in element_or_list:
+        if isinstance(e, list):
+            break
+    else:
+        return list(element_or_list)
+    result = []
+    stack = [iter(element_or_list)]
+    while len(stack) > 0:
+        for e in stack[-1]:
+            if isinstance(e, list):
+                # continue with the nested list, then resume this one where it was left
+                stack.append(iter(e))
+                break
+            result.append(e)
         else:
-            yield elem
-    g = _iter_all_generator(element_or_list)
-    return [e for e in g]
\ No newline at end of file
+            stack.pop()
+    return result
+
+
+def _is_span(element):
+    return isinstance(element, (list, tuple)) and len(element) == 2 and not isinstance(element[0], (list, tuple))
+
+
+def flatten_spans(spans, out=None, dtype=None):
+    '''
+    Flattens nested lists of (begin, end) spans into an int array, e.g. [[(0, 3)], [(4, 6), [(7, 9)]]] gives
+    [[0, 3], [4, 6], [7, 9]]. The spans are written directly into the array, without building a flat list first.
+    :param spans: a span, or (nested) lists/tuples of spans
+    :param out: preallocated int array of shape (>= amount of spans, 2) to fill. If None, an array of the right size is
+    allocated (counting the spans first)
+    :param dtype: dtype of the allocated array (np.int64 by default). Ignored if *out* is given
+    :return: the (amount of spans, 2) array (a view of *out*, if given)
+    '''
+    if _is_span(spans):
+        spans = [spans]
+    if out is None:
+        count, stack = 0, [iter(spans)]
+        while len(stack) > 0:
+            for e in stack[-1]:
+                if _is_span(e):
+                    count += 1
+                else:
+                    stack.append(iter(e))
+                    break
+            else:
+                stack.pop()
+        out = np.empty((count, 2), dtype=np.int64 if dtype is None else dtype)
+    n, stack = 0, [iter(spans)]
+    while len(stack) > 0:
+        for e in stack[-1]:
+            if _is_span(e):
+                out[n, 0], out[n, 1] = e
+                n += 1
+            else:
+                stack.append(iter(e))
+                break
+        else:
+            stack.pop()
+    return out[:n]
+
+def _is_sequence(value):
+    return isinstance(value, (list, tuple)) or (hasattr(value, "ndim") and value.ndim > 0)
+
+
+def pad_batch_collator(batch, pad_values=None, length_key=None, as_tensors=True):
+    '''
+    Collates a list of samples (dicts with the same keys) in a batch, e.g. as DataLoader collate_fn. Sequence fields
+    (lists or arrays, also with more axes, e.g. (tokens, roles) labels) are padded along their first axis to the longest
+    sample of the batch and stacked; the other fields (e.g. ids) are kept as lists. "lengths" and "mask" are added.
+    E.g. [{"id": "a", "x": [1, 2]}, {"id": "b", "x": [3]}] gives {"id": ["a", "b"], "x": [[1, 2], [3, 0]],
+    "lengths": [2, 1], "mask": [[True, True], [True, False]]}
+    :param batch: list of samples
+    :param pad_values: dict field -> padding value. Missing fields are padded with 0
+    :param length_key: sequence field whose lengths are the sample lengths. If None, the first sequence field is used
+    :param as_tensors: if True, the padded fields, lengths and mask are torch tensors, otherwise numpy arrays
+    :return: dict field -> batched values
+    '''
+    pad_values = {} if pad_values is None else pad_values
+    result = {}
+    for key in batch[0].keys():
+        values = [sample[key] for sample in batch]
+        if not _is_sequence(values[0]) or isinstance(values[0][0] if len(values[0]) > 0 else 0, str):
+            result[key] = values
+            continue
+        arrays = [np.asarray(v) for v in values]
+        if length_key is None:
+            length_key = key
+        max_length = max(len(a) for a in arrays)
+        reference = max(arrays, key=len)
+        padded = np.full((len(arrays), max_length) + reference.shape[1:], pad_values.get(key, 0), dtype=reference.dtype)
+        for i, a in enumerate(arrays):
+            padded[i, :len(a)] = a
+        result[key] = padded
+    assert length_key is not None, "There are no sequence fields to pad"
+    lengths = np.array([len(sample[length_key]) for sample in batch], dtype=np.int64)
+    result["lengths"] = lengths
+    result["mask"] = np.arange(max(lengths, default=0))[None, :] < lengths[:, None]
+    if as_tensors:
+        import torch
+        for key, value in result.items():
+            if isinstance(value, np.ndarray):
+                result[key] = torch.from_numpy(value)
+    return result
+
+
+def bucket_batches(lengths, batch_size=None, max_tokens=None, bucket_size=100, shuffle=True, seed=None):
+    '''
+    Groups samples of similar length in the same batches, so that little padding is needed. Samples are shuffled,
+    split in buckets of *bucket_size* batches, and sorted by length inside each bucket. Batches are either of
+    *batch_size* samples or (with *max_tokens*) as large as possible with at most *max_tokens* tokens after padding,
+    i.e. batch size * longest sample <= max_tokens (a longer sample gets a batch of its own).
+    :param lengths: list (or array) of sample lengths
+    :param batch_size: samples of each batch. Alternative to max_tokens
+    :param max_tokens: token budget of each batch. Alternative to batch_size
+    :param bucket_size: amount of batches (or of max_tokens worth of samples) sorted together. Larger buckets give
+    less padding and less randomness
+    :param shuffle: if False, the samples are sorted by length all at once, and the batches are not shuffled
+    :param seed: random seed (numpy)
+    :return: list of batches, each a list of sample positions
+    '''
+    assert (batch_size is None) != (max_tokens is None), "Exactly one of batch_size and max_tokens must be given"
+    lengths = np.asarray(lengths, dtype=np.int64)
+    if len(lengths) == 0:
+        return []
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(lengths)) if shuffle else np.arange(len(lengths))
+    if shuffle:
+        chunk = bucket_size * (batch_size if batch_size is not None else max(1, max_tokens // max(1, int(lengths.mean()))))
+    else:
+        chunk = max(1, len(lengths))
+    batches = []
+    for start in range(0, len(order), chunk):
+        bucket = order[start:start + chunk]
+        bucket = bucket[np.argsort(lengths[bucket], kind="stable")]
+        if batch_size is not None:
+            batches += [bucket[i:i + batch_size].tolist() for i in range(0, len(bucket), batch_size)]
+            continue
+        batch, longest = [], 0
+        for i in bucket:
+            # the bucket is sorted, so the new sample is the longest one
+            if len(batch) > 0 and (len(batch) + 1) * max(longest, lengths[i]) > max_tokens:
+                batches.append(batch)
+                batch, longest = [], 0
+            batch.append(int(i))
+            longest = max(longest, int(lengths[i]))
+        if len(batch) > 0:
+            batches.append(batch)
+    if shuffle:
+        batches = [batches[i] for i in rng.permutation(len(batches))]
+    return batches
+
+
+class BucketBatchSampler:
+    '''
+    DataLoader batch_sampler yielding length-bucketed batches (see bucket_batches), reshuffled at each epoch.
+    E.g. DataLoader(dataset, batch_sampler=BucketBatchSampler(lengths, max_tokens=4096), collate_fn=DynamicBatchCollator())
+    '''
+    def __init__(self, lengths, batch_size=None, max_tokens=None, bucket_size=100, shuffle=True, seed=0):
+        self.lengths = lengths
+        self.kwargs = {"batch_size": batch_size, "max_tokens": max_tokens, "bucket_size": bucket_size, "shuffle": shuffle}
+        self.seed, self.epoch = seed, 0
+        self._batches = bucket_batches(lengths, seed=seed, **self.kwargs)
+
+    def __iter__(self):
+        batches = self._batches
+        self.epoch += 1
+        self._batches = bucket_batches(self.lengths, seed=self.seed + self.epoch, **self.kwargs)
+        return iter(batches)
+
+    def __len__(self):
+        return len(self._batches)
+
+
+class DynamicBatchCollator:
+    '''
+    pad_batch_collator that also measures the padding waste (padded positions / all the positions) and the collation
+    time of each batch. The latency of each training step is measured by iterating the batches with timed, e.g.
+    for batch in collator.timed(DataLoader(dataset, batch_sampler=sampler, collate_fn=collator)): ...
+    Padding and collation time are only counted when the batches are collated in this process (i.e. DataLoader with
+    num_workers=0), since the workers have their own copy of the collator.
+    '''
+    def __init__(self, pad_values=None, length_key=None, as_tensors=True):
+        self.kwargs = {"pad_values": pad_values, "length_key": length_key, "as_tensors": as_tensors}
+        self.reset()
+
+    def reset(self):
+        self.batches, self.tokens, self.padded_tokens, self.latencies = 0, 0, 0, []
+        self.wait_latencies, self.step_latencies = [], []
+
+    def __call__(self, batch):
+        start = time.perf_counter()
+        result = pad_batch_collator(batch, **self.kwargs)
+        self.latencies.append(time.perf_counter() - start)
+        lengths = result["lengths"]
+        self.batches += 1
+        self.tokens += int(lengths.sum())
+        self.padded_tokens += int(len(lengths) * lengths.max()) if len(lengths) > 0 else 0
+        return result
+
+    def timed(self, batches):
+        '''
+        Yields the batches, measuring the latency of each step: the time waiting for the batch (loading and collation)
+        plus the time spent by the caller on it (e.g. forward and backward pass) before asking for the next one.
+        :param batches: iterable of batches, e.g. a DataLoader
+        :return: generator of the batches
+        '''
+        iterator = iter(batches)
+        while True:
+            start = time.perf_counter()
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                return
+            self.wait_latencies.append(time.perf_counter() - start)
+            yield batch
+            self.step_latencies.append(time.perf_counter() - start)
+
+    def stats(self):
+        '''
+        :return: dict with the amount of batches, the padding waste ratio, and the mean and max collation time, time
+        waiting for a batch and step latency (ms, see timed)
+        '''
+        result = {
+            "batches": self.batches,
+            "padding_ratio": 1 - self.tokens / self.padded_tokens if self.padded_tokens > 0 else 0.0,
+        }
+        for name, latencies in [("collate", self.latencies), ("wait", self.wait_latencies), ("step", self.step_latencies)]:
+            result[f"mean_{name}_ms"] = 1000 * sum(latencies) / len(latencies) if len(latencies) > 0 else 0.0
+            result[f"max_{name}_ms"] = 1000 * max(latencies, default=0.0)
+        return result
+
+
+# ids of the padding and of the tokens that are not in the vocabulary, see build_vocabulary
+PAD_ID, UNK_ID = 0, 1
+
+
+def _record_tokens(token_index, texts, i):
+    text = texts[i]
+    return [text[b:e] for b, e in token_index.offsets(i).tolist()]
+
+
+def build_vocabulary(token_index, texts, min_count=1):
+    '''
+    :param token_index: utils.tokens.TokenIndex
+    :param texts: texts of its records, by position (e.g. [record["text"] for _, record in iter_srl4e(path)])
+    :param min_count: tokens occurring less than *min_count* times are left out (i.e. mapped to UNK_ID)
+    :return: dict token -> id, with "<pad>" (PAD_ID) and "<unk>" (UNK_ID), then the most frequent tokens first
+    '''
+    counts = {}
+    for i in range(len(token_index)):
+        for token in _record_tokens(token_index, texts, i):
+            counts[token] = counts.get(token, 0) + 1
+    vocabulary = {"<pad>": PAD_ID, "<unk>": UNK_ID}
+    for token, count in sorted(counts.items(), key=lambda x: (-x[1], x[0])):
+        if count >= min_count:
+            vocabulary[token] = len(vocabulary)
+    return vocabulary
+
+
+def srl4e_samples(token_index, texts, vocabulary=None):
+    '''
+    Training samples of a utils.tokens.TokenIndex, one for each emotion: {"id": emotion id, "text": (tokens,) token
+    ids, "offsets": (tokens, 2) char offsets, "cue": (tokens,) cue BIO tags, "roles": (tokens, 3) experiencer, target
+    and cause BIO tags}.
+    :param token_index: utils.tokens.TokenIndex
+    :param texts: texts of its records, by position (see build_vocabulary)
+    :param vocabulary: dict token -> id. If None, it is built with build_vocabulary
+    :return: list of samples, to be collated with pad_batch_collator (the lengths are their amount of tokens, and the
+    text is padded with PAD_ID)
+    '''
+    assert len(texts) == len(token_index), "There must be a text for each record of the token index"
+    vocabulary = build_vocabulary(token_index, texts) if vocabulary is None else vocabulary
+    token_ids = {}  # record -> token ids, shared by its emotions
+    samples = []
+    for j in range(len(token_index.emotion_ids)):
+        i = token_index.emotion_records[j]
+        if i not in token_ids:
+            token_ids[i] = np.array([vocabulary.get(t, UNK_ID) for t in _record_tokens(token_index, texts, i)],
+                                    dtype=np.int64)
+        labels = token_index.labels[token_index.label_pointers[j]:token_index.label_pointers[j + 1]]
+        samples.append({"id": str(token_index.emotion_ids[j]), "text": token_ids[i], "offsets": token_index.offsets(i),
+                        "cue": labels[:, 0], "roles": labels[:, 1:]})
+    return samples
@@ -0,0 +1,185 @@
+import numpy as np
+from utils.tokens import ROLES, token_offsets
+
+METRICS = ["exact", "proportional", "binary"]
+
+
+def token_ranges(offsets, spans):
+    '''
+    Maps char spans to the [begin, end) ranges of the tokens they overlap. Spans that do not refer to the text (e.g.
+    the (-1, -1) author experiencers and targets of Elections) are mapped to the pseudo-token range (-1, 0), so that
+    they only overlap each other.
+    :param offsets: int array of shape (tokens, 2), see utils.tokens.token_offsets
+    :param spans: list (or array) of [begin, end) char spans
+    :return: int64 array of shape (spans, 2)
+    '''
+    spans = np.asarray(spans, dtype=np.int64).reshape(-1, 2)
+    begins = np.searchsorted(offsets[:, 1], spans[:, 0], side="right")
+    ends = np.maximum(np.searchsorted(offsets[:, 0], spans[:, 1], side="left"), begins)
+    ranges = np.stack([begins, ends], axis=1).astype(np.int64)
+    ranges[spans[:, 0] < 0] = (-1, 0)
+    return ranges
+
+
+def _prf(correct_predicted, predicted, correct_gold, gold):
+    precision = np.divide(correct_predicted, predicted, out=np.zeros(len(predicted)), where=predicted > 0)
+    recall = np.divide(correct_gold, gold, out=np.zeros(len(gold)), where=gold > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros(len(gold)), where=precision + recall > 0)
+    return precision, recall, f1
+
+
+class SpanScorer:
+    '''
+    Span-level scorer of SRL4E predictions. The gold spans are tokenized and indexed once, so that many predictions
+    (e.g. several seeds) can be scored against them. Predictions are SRL4E records (same ids of the gold ones), and
+    their spans are compared with the gold spans of the same emotion id and role, with:
+    - exact: a span is correct if the same char span is in the other set;
+    - proportional: a span counts as the fraction of its tokens covered by the best overlapping span of the other set;
+    - binary: a span is correct if it overlaps (at least one token) a span of the other set.
+    Precision is computed over the predicted spans, recall over the gold ones. All the spans of a file are scored at once
+    with interval arrays: there is no Python loop over span pairs.
+    '''
+    def __init__(self, gold, roles=None):
+        '''
+        :param gold: dict (or iterable of (index, record) tuples) of gold SRL4E records, see utils.srl4e.iter_srl4e
+        :param roles: roles to score. If None, utils.tokens.ROLES are scored
+        '''
+        self.roles = ROLES if roles is None else roles
+        self._offsets = {}
+        # (emotion id, role) -> group, and the dataset and plutchik emotion codes of each group
+        self._gold_vocabulary = {"groups": {}, "group_datasets": [], "group_emotions": [], "datasets": [], "emotions": []}
+        gold = gold.items() if isinstance(gold, dict) else gold
+        groups, chars, tokens = self._spans(gold, self._gold_vocabulary, add_records=True)
+        self._gold_groups, self._gold_chars, self._gold_tokens = groups, chars, tokens
+        self.datasets, self.emotions = self._gold_vocabulary["datasets"], self._gold_vocabulary["emotions"]
+
+    @staticmethod
+    def _code(labels, label):
+        if label not in labels:
+            labels.append(label)
+        return labels.index(label)
+
+    def _group(self, vocabulary, index, emotion_index, emotion, role):
+        key = (emotion_index, role)
+        groups = vocabulary["groups"]
+        if key not in groups:
+            groups[key] = len(groups)
+            vocabulary["group_datasets"].append(self._code(vocabulary["datasets"], index.split(".")[0]))
+            plutchik = emotion.get("plutchik_emotion")
+            plutchik = ["none"] if plutchik is None else [plutchik] if isinstance(plutchik, str) else plutchik
+            vocabulary["group_emotions"].append(sorted({self._code(vocabulary["emotions"], p) for p in plutchik}))
+        return groups[key]
+
+    def _spans(self, records, vocabulary, add_records=False):
+        '''
+        :param vocabulary: groups and labels (see __init__), extended with the groups of the records
+        :return: (groups, char spans, token ranges) arrays of the unique spans of the records, sorted by group
+        '''
+        groups, chars, tokens = [], [], []
+        for index, record in records:
+            if add_records:
+                self._offsets[index] = token_offsets(record["text"])
+            assert index in self._offsets, f"Record '{index}' is not in the gold records"
+            for emotion_index, emotion in record["emotions"].items():
+                for role in self.roles:
+                    spans = emotion["roles"].get(role, [])
+                    if len(spans) == 0:
+                        continue
+                    spans = np.unique(np.asarray(spans, dtype=np.int64).reshape(-1, 2), axis=0)
+                    groups.append(np.full(len(spans), self._group(vocabulary, index, emotion_index, emotion, role)))
+                    chars.append(spans)
+                    tokens.append(token_ranges(self._offsets[index], spans))
+        if len(groups) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros((0, 2), dtype=np.int64), np.zeros((0, 2), dtype=np.int64)
+        groups, chars, tokens = np.concatenate(groups), np.concatenate(chars), np.concatenate(tokens)
+        order = np.argsort(groups, kind="stable")
+        return groups[order], chars[order], tokens[order]
+
+    @staticmethod
+    def _match(groups_a, chars_a, tokens_a, groups_b, chars_b, tokens_b, n_groups):
+        '''
+        Compares each span of a with the spans of b in the same group.
+        :return: (exact, proportional, binary) float arrays with the score of each span of a
+        '''
+        counts_b = np.bincount(groups_b, minlength=n_groups)
+        starts_b = np.concatenate([[0], np.cumsum(counts_b)[:-1]])
+        # all the (a, b) pairs of spans in the same group
+        pair_counts = counts_b[groups_a]
+        pairs_a = np.repeat(np.arange(len(groups_a)), pair_counts)
+        pairs_b = starts_b[groups_a][pairs_a] + np.arange(len(pairs_a)) - np.repeat(
+            np.cumsum(pair_counts) - pair_counts, pair_counts)
+        a, b = tokens_a[pairs_a], tokens_b[pairs_b]
+        intersection = np.clip(np.minimum(a[:, 1], b[:, 1]) - np.maximum(a[:, 0], b[:, 0]), 0, None)
+        lengths_a = np.maximum(tokens_a[:, 1] - tokens_a[:, 0], 1)
+
+        exact, proportional, binary = np.zeros(len(groups_a)), np.zeros(len(groups_a)), np.zeros(len(groups_a))
+        exact[pairs_a[(chars_a[pairs_a] == chars_b[pairs_b]).all(axis=1)]] = 1
+        np.maximum.at(proportional, pairs_a, np.minimum(intersection / lengths_a[pairs_a], 1))
+        binary[pairs_a[intersection > 0]] = 1
+        return exact, proportional, binary
+
+    def score(self, predictions):
+        '''
+        :param predictions: dict (or iterable of (index, record) tuples) of predicted SRL4E records
+        :return: dict {"overall": {role: scores}, "dataset": {dataset: {role: scores}}, "emotion": {plutchik emotion:
+        {role: scores}}}, where role is one of the scored roles or "all" (micro average over the roles), and scores is
+        {metric: {"precision", "recall", "f1", "predicted", "gold"}} for each metric in METRICS. Spans of emotions with
+        more than one plutchik emotion count for each of them
+        '''
+        predictions = predictions.items() if isinstance(predictions, dict) else predictions
+        # groups that are only in the predictions get ids (and labels, from the predicted emotion) for this call only,
+        # so that scoring does not change the scorer
+        vocabulary = {name: list(v) for name, v in self._gold_vocabulary.items() if name != "groups"}
+        vocabulary["groups"] = dict(self._gold_vocabulary["groups"])
+        pred_groups, pred_chars, pred_tokens = self._spans(predictions, vocabulary)
+        gold_groups, gold_chars, gold_tokens = self._gold_groups, self._gold_chars, self._gold_tokens
+        n_groups = len(vocabulary["groups"])
+
+        precision_scores = self._match(pred_groups, pred_chars, pred_tokens, gold_groups, gold_chars, gold_tokens, n_groups)
+        recall_scores = self._match(gold_groups, gold_chars, gold_tokens, pred_groups, pred_chars, pred_tokens, n_groups)
+        # per group sums: predicted, gold, and the correct predicted and gold spans of each metric
+        predicted = np.bincount(pred_groups, minlength=n_groups).astype(np.float64)
+        gold = np.bincount(gold_groups, minlength=n_groups).astype(np.float64)
+        correct_predicted = [np.bincount(pred_groups, weights=s, minlength=n_groups) for s in precision_scores]
+        correct_gold = [np.bincount(gold_groups, weights=s, minlength=n_groups) for s in recall_scores]
+
+        group_roles = np.zeros(n_groups, dtype=np.int64)
+        for (_, role), g in vocabulary["groups"].items():
+            group_roles[g] = self.roles.index(role)
+        group_datasets = np.array(vocabulary["group_datasets"], dtype=np.int64)
+        # emotions with more than one plutchik emotion are repeated once for each of them
+        group_emotions = vocabulary["group_emotions"]
+        emotion_group = np.array([g for g, e in enumerate(group_emotions) for _ in e], dtype=np.int64)
+        emotion_codes = np.array([c for e in group_emotions for c in e], dtype=np.int64)
+
+        def _aggregate(keys, names, selected=None):
+            selected = np.arange(n_groups) if selected is None else selected
+            result = {}
+            # key * (roles + 1) + role, where the last role is "all"
+            n_roles = len(self.roles) + 1
+            codes = np.concatenate([keys * n_roles + group_roles[selected], keys * n_roles + n_roles - 1])
+            selected = np.concatenate([selected, selected])
+            size = len(names) * n_roles
+
+            def _sum(values):
+                return np.bincount(codes, weights=values[selected], minlength=size)
+
+            totals_predicted, totals_gold = _sum(predicted), _sum(gold)
+            metrics = {}
+            for m, metric in enumerate(METRICS):
+                metrics[metric] = _prf(_sum(correct_predicted[m]), totals_predicted, _sum(correct_gold[m]), totals_gold)
+            for k, name in enumerate(names):
+                result[name] = {}
+                for r, role in enumerate(self.roles + ["all"]):
+                    code = k * n_roles + r
+                    result[name][role] = {metric: {
+                        "precision": float(p[code]), "recall": float(rc[code]), "f1": float(f[code]),
+                        "predicted": int(totals_predicted[code]), "gold": int(totals_gold[code])
+                    } for metric, (p, rc, f) in metrics.items()}
+            return result
+
+        return {
+            "overall": _aggregate(np.zeros(n_groups, dtype=np.int64), ["overall"])["overall"],
+            "dataset": _aggregate(group_datasets, vocabulary["datasets"]),
+            "emotion": _aggregate(emotion_codes, vocabulary["emotions"], selected=emotion_group)
+        }
@@ -0,0 +1,271 @@
+import json
+import os
+import re
+import numpy as np
+
+
+class SRL4EWriter:
+    '''
+    Output sink of the converters, used like the `result` dict they used to build: `result[index] = {...}` starts a new
+    record, which can still be modified (or deleted with `del result[index]`) until the next record is started.
+    With jsonl=False (default) all the records are kept in memory and dumped in a single pretty-printed JSON file on
+    close(), as before. With jsonl=True each record is written as soon as the next one starts, as a one-line
+    {"<dataset>.NNNNNNN": {...}} JSON object, so memory does not grow with the dataset size. Already written records
+    cannot be accessed anymore.
+    '''
+    def __init__(self, path, jsonl=False):
+        '''
+        :param path: output path. With jsonl=True, its extension is replaced by ".jsonl"
+        :param jsonl: whether to stream the records to a JSONL file
+        '''
+        self.jsonl = jsonl
+        self.path = os.path.splitext(path)[0] + ".jsonl" if jsonl else path
+        self._records = {}  # all the records (json) or only the pending one (jsonl)
+        self._file = open(self.path, "w") if jsonl else None
+        self.written = 0
+
+    def _flush(self):
+        for index, record in self._records.items():
+            self._file.write(json.dumps({index: record}, sort_keys=True) + "\n")
+            self.written += 1
+        self._records = {}
+
+    def __setitem__(self, index, record):
+        if self.jsonl and index not in self._records:
+            self._flush()
+        self._records[index] = record
+
+    def __getitem__(self, index):
+        return self._records[index]
+
+    def __delitem__(self, index):
+        del self._records[index]
+
+    def __contains__(self, index):
+        return index in self._records
+
+    def close(self):
+        '''
+        Writes the pending records and closes the output file.
+        '''
+        if self.jsonl:
+            self._flush()
+            self._file.close()
+        else:
+            with open(self.path, "w") as f:
+                json.dump(self._records, f, sort_keys=True, indent=4)
+            self.written = len(self._records)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def iter_srl4e(path):
+    '''
+    Iterates over the records of a SRL4E file, either JSON or JSONL (the JSONL records are read one at a time).
+    :param path: path of a SRL4E_*.json or SRL4E_*.jsonl file
+    :return: generator of (index, record) tuples
+    '''
+    if path.endswith(".jsonl"):
+        with open(path) as f:
+            for line in f:
+                if line.strip() != "":
+                    yield from json.loads(line).items()
+    else:
+        with open(path) as f:
+            yield from json.load(f).items()
+
+
+def load_srl4e(path):
+    '''
+    Loads a SRL4E file, either JSON or JSONL, into the same {"<dataset>.NNNNNNN": {...}} dict.
+    :param path: path of a SRL4E_*.json or SRL4E_*.jsonl file
+    :return: dict of records
+    '''
+    return dict(iter_srl4e(path))
+
+
+# fields of the emotions stored as vocabulary codes in the binary format. Other fields (and record fields other than
+# "text" and "emotions", e.g. REMAN main_sentence) are kept as JSON in a separate blob
+_LABEL_FIELDS = ["original_emotion", "plutchik_emotion", "sentiment"]
+_ROLES = ["cue", "experiencer", "target", "cause"]
+_NUMBERED_ID = re.compile(r"(\w+)\.(\d+)")
+
+
+def _json_key(value):
+    return json.dumps(value, sort_keys=True)
+
+
+def write_srl4e_binary(records, path):
+    '''
+    Writes SRL4E records in a compact binary format that SRL4EBinary reads with memory maps. *path* is a directory with:
+    the UTF-8 texts concatenated in text.bin, the role spans in a (spans, 2) int32 array, the emotion labels as int32
+    vocabulary codes, the byte/span offsets as int64 pointer arrays (.npy files), and the vocabularies in meta.json.
+    Record ids must be "<dataset>.<number>" ids, as written by the converters.
+    :param records: iterable of (index, record) tuples, e.g. iter_srl4e(path)
+    :param path: output directory
+    :return: amount of written records
+    '''
+    os.makedirs(path, exist_ok=True)
+    dataset, numbers, text_pointers, extra_pointers = None, [], [0], [0]
+    emotion_pointers, emotion_numbers, labels, role_masks, role_pointers, spans = [0], [], [], [], [0], []
+    vocabulary = {f: {} for f in _LABEL_FIELDS}
+    with open(os.path.join(path, "text.bin"), "wb") as text_file, open(os.path.join(path, "extra.bin"), "wb") as extra_file:
+        for index, record in records:
+            match = _NUMBERED_ID.fullmatch(index)
+            assert match is not None, f"Record id '{index}' is not a <dataset>.<number> id"
+            assert dataset in (None, match.group(1)), f"Record '{index}' does not belong to dataset '{dataset}'"
+            dataset = match.group(1)
+            numbers.append(int(match.group(2)))
+            text_pointers.append(text_pointers[-1] + text_file.write(record["text"].encode("utf-8")))
+            extra = {k: v for k, v in record.items() if k not in ["text", "emotions"]}
+            for emotion_index, emotion in record["emotions"].items():
+                assert emotion_index.startswith(index + "."), f"Emotion '{emotion_index}' does not belong to '{index}'"
+                emotion_numbers.append(int(emotion_index[len(index) + 1:]))
+                # -1: the emotion has no such field
+                labels.append([vocabulary[f].setdefault(_json_key(emotion[f]), len(vocabulary[f])) if f in emotion
+                               else -1 for f in _LABEL_FIELDS])
+                mask = 0
+                for r, role in enumerate(_ROLES):
+                    if role in emotion["roles"]:
+                        mask |= 1 << r
+                        spans += [span for span in emotion["roles"][role]]
+                    role_pointers.append(len(spans))
+                role_masks.append(mask)
+                other = {k: v for k, v in emotion.items() if k not in _LABEL_FIELDS + ["roles"]}
+                if len(other) > 0:
+                    extra.setdefault("emotions", {})[emotion_index] = other
+            emotion_pointers.append(len(emotion_numbers))
+            extra = json.dumps(extra, sort_keys=True).encode("utf-8") if len(extra) > 0 else b""
+            extra_pointers.append(extra_pointers[-1] + extra_file.write(extra))
+
+    numbers = np.array(numbers, dtype=np.int64)
+    number2index = np.full(numbers.max() + 1 if len(numbers) > 0 else 0, -1, dtype=np.int32)
+    number2index[numbers] = np.arange(len(numbers), dtype=np.int32)
+    arrays = {
+        "numbers": numbers,
+        "number2index": number2index,
+        "text_pointers": np.array(text_pointers, dtype=np.int64),
+        "extra_pointers": np.array(extra_pointers, dtype=np.int64),
+        "emotion_pointers": np.array(emotion_pointers, dtype=np.int64),
+        "emotion_numbers": np.array(emotion_numbers, dtype=np.int16),
+        "labels": np.array(labels, dtype=np.int32).reshape(-1, len(_LABEL_FIELDS)),
+        "role_masks": np.array(role_masks, dtype=np.uint8),
+        "role_pointers": np.array(role_pointers, dtype=np.int64),
+        "spans": np.array(spans, dtype=np.int32).reshape(-1, 2)
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + ".npy"), array)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({
+            "dataset": dataset,
+            "id_width": len(index) - len(dataset) - 1 if dataset is not None else 0,
+            "roles": _ROLES,
+            "labels": {f: [json.loads(k) for k in sorted(v, key=v.get)] for f, v in vocabulary.items()}
+        }, f, indent=4)
+    return len(numbers)
+
+
+class SRL4EBinary:
+    '''
+    Reader of the binary format written by write_srl4e_binary. All the arrays are memory-mapped, so opening is
+    instantaneous, only the accessed records are read, and worker processes share the same pages of the OS cache.
+    Records are accessed in O(1) by position (corpus[42]) or by id (corpus["gne.0000042"]). Pickling only stores the
+    path, so the reader can be passed to DataLoader workers.
+    '''
+    def __init__(self, path):
+        '''
+        :param path: directory written by write_srl4e_binary
+        '''
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.dataset, self.roles = self.meta["dataset"], self.meta["roles"]
+        self._arrays = {}
+        self._blobs = {}
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def _array(self, name):
+        if name not in self._arrays:
+            self._arrays[name] = np.load(os.path.join(self.path, name + ".npy"), mmap_mode="r")
+        return self._arrays[name]
+
+    def _blob(self, name, begin, end):
+        if begin == end:
+            return b""
+        if name not in self._blobs:
+            self._blobs[name] = np.memmap(os.path.join(self.path, name + ".bin"), dtype=np.uint8, mode="r")
+        return self._blobs[name][begin:end].tobytes()
+
+    def __len__(self):
+        return len(self._array("numbers"))
+
+    def ids(self):
+        '''
+        :return: list of the record ids, in order
+        '''
+        return [self._id(n) for n in self._array("numbers")]
+
+    def _id(self, number):
+        return self.dataset + "." + str(int(number)).zfill(self.meta["id_width"])
+
+    def position(self, index):
+        '''
+        :param index: record id (e.g. "gne.0000042")
+        :return: position of the record
+        '''
+        match = _NUMBERED_ID.fullmatch(index)
+        if match is None or match.group(1) != self.dataset:
+            raise KeyError(index)
+        number, number2index = int(match.group(2)), self._array("number2index")
+        if number >= len(number2index) or number2index[number] == -1:
+            raise KeyError(index)
+        return int(number2index[number])
+
+    def text(self, i):
+        '''
+        :param i: position of the record
+        :return: its text
+        '''
+        pointers = self._array("text_pointers")
+        return self._blob("text", pointers[i], pointers[i + 1]).decode("utf-8")
+
+    def __getitem__(self, i):
+        '''
+        :param i: position or id of the record
+        :return: the record, as in the SRL4E json files
+        '''
+        if isinstance(i, str):
+            i = self.position(i)
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        index = self._id(self._array("numbers")[i])
+        extra_pointers = self._array("extra_pointers")
+        extra = self._blob("extra", extra_pointers[i], extra_pointers[i + 1])
+        extra = json.loads(extra) if len(extra) > 0 else {}
+        record = {"text": self.text(i), "emotions": {}}
+        emotion_pointers, emotion_numbers = self._array("emotion_pointers"), self._array("emotion_numbers")
+        labels, role_masks = self._array("labels"), self._array("role_masks")
+        role_pointers, spans = self._array("role_pointers"), self._array("spans")
+        for e in range(emotion_pointers[i], emotion_pointers[i + 1]):
+            emotion_index = index + "." + str(int(emotion_numbers[e])).zfill(2)
+            emotion = {f: self.meta["labels"][f][labels[e, k]] for k, f in enumerate(_LABEL_FIELDS) if labels[e, k] != -1}
+            emotion["roles"] = {}
+            for r, role in enumerate(self.roles):
+                if role_masks[e] & (1 << r):
+                    begin, end = role_pointers[e * len(self.roles) + r], role_pointers[e * len(self.roles) + r + 1]
+                    emotion["roles"][role] = spans[begin:end].tolist()
+            emotion.update(extra.get("emotions", {}).get(emotion_index, {}))
+            record["emotions"][emotion_index] = emotion
+        record.update({k: v for k, v in extra.items() if k != "emotions"})
+        return record
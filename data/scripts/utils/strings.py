@@ -1,19 +1,107 @@
 import warnings
 
+import hashlib
+import heapq
+import json
+import os
+import sqlite3
 import regex
 from typing import List, Union, Tuple
-from collections import Counter
-from itertools import groupby
+import numpy as np
 from utils import deep_flatten
-from nltk.tokenize import RegexpTokenizer
+from utils.data import flatten_spans
+from utils.cache import LRUCache, CacheInfo, fingerprint_files
+from utils.tokenizers import get_tokenizer
 import edlib
 # from fuzzywuzzy import fuzz
 
 
-def fuzzy_search(sub, text, max_typos=3, word_borders=False, best_match=True, ignore_case=True):
+# compiled fuzzy patterns, keyed by (sub, max_typos, word_borders, best_match, ignore_case)
+_FUZZY_PATTERN_CACHE = LRUCache(maxsize=4096)
+
+
+def _compile_fuzzy_pattern(sub, max_typos, word_borders, best_match, ignore_case):
+    """
+    Returns the compiled regex fuzzy pattern for the given parameters, compiling it only on a cache miss.
+    See fuzzy_search for the parameters.
+    """
+    key = (sub, max_typos, word_borders, best_match, ignore_case)
+    pattern = _FUZZY_PATTERN_CACHE.get(key)
+    if pattern is None:
+        sub = regex.escape(sub)
+        r_typos = r"" if max_typos is None else fr"<={max_typos}"
+        r_best_match = r"b" if best_match else r"e"
+        r_borders = r"\b" if word_borders else ""
+        r = r_borders + r'(?' + r_best_match + ')(' + sub + r'){e' + r_typos + r'}' + r_borders
+        pattern = regex.compile(r, flags=regex.IGNORECASE if ignore_case else 0)
+        _FUZZY_PATTERN_CACHE.put(key, pattern)
+    return pattern
+
+
+def fuzzy_search_cache_info():
+    """
+    :return: a CacheInfo(hits, misses, evictions, size, maxsize) namedtuple for the compiled fuzzy pattern cache.
+    """
+    return _FUZZY_PATTERN_CACHE.info()
+
+
+def fuzzy_search_cache_clear():
+    """
+    Empties the compiled fuzzy pattern cache and resets its counters.
+    """
+    _FUZZY_PATTERN_CACHE.clear()
+
+
+# characters whose regex IGNORECASE matching is not an equivalence relation (İ matches i, i matches I, I matches ı, but
+# İ does not match I), so no folding of the strings can reproduce it
+_INCONSISTENT_CASE_CHARS = frozenset("İı")
+
+
+def _fold_case(text):
+    """
+    Simple case folding of *text* (each character is replaced by its one-character case fold, if any), so that char
+    indices computed on the result are valid for the original text and two characters are equal after folding iff the
+    regex module matches them with IGNORECASE (except for _INCONSISTENT_CASE_CHARS).
+    """
+    folded = text.casefold()
+    if len(folded) == len(text):
+        return folded
+    result = []
+    for c in text:
+        f = c.casefold()
+        if len(f) != 1:
+            f = c.lower() if len(c.lower()) == 1 else c
+        result.append(f)
+    return "".join(result)
+
+
+def _edlib_fuzzy_search(sub, text, max_typos, ignore_case):
+    """
+    Bit-parallel (Myers) approximate search based on edlib in infix (HW) mode, returning the same span of the regex
+    BESTMATCH search. See fuzzy_search for the parameters.
+    The minimum edit distance d and the leftmost start of a span with d typos are found aligning the reversed strings
+    (the end of a reversed location is the start of the original one). The span end is then taken from an anchored
+    regex match with at most d typos, which is cheap, since it only spans len(sub) + d characters.
+    """
+    if len(sub) == 0:
+        return 0, 0
+    if len(text) == 0 or ignore_case and not _INCONSISTENT_CASE_CHARS.isdisjoint(sub + text):
+        return fuzzy_search(sub, text, max_typos=max_typos, ignore_case=ignore_case, engine="regex")
+    query, target = (_fold_case(sub), _fold_case(text)) if ignore_case else (sub, text)
+    result = edlib.align(query[::-1], target[::-1], mode="HW", task="locations",
+                         k=-1 if max_typos is None else max_typos)
+    if result["editDistance"] == -1:
+        return None
+    typos = result["editDistance"]
+    start = len(text) - 1 - max(loc[1] for loc in result["locations"])
+    pattern = _compile_fuzzy_pattern(sub, typos, False, False, ignore_case)
+    return pattern.match(text, start, min(len(text), start + len(sub) + typos)).span()
+
+
+def fuzzy_search(sub, text, max_typos=3, word_borders=False, best_match=True, ignore_case=True, engine="edlib"):
     """
     Fuzzy search, i.e. search a fuzzy/approximated substring with typos and returns its span char indices in the text.
-    The best match is always returned.
+    The best match is always returned. Compiled patterns are kept in a bounded LRU cache (see fuzzy_search_cache_info).
 
     :param sub: the sub to search.
     :param text: the text to search in.
@@ -23,20 +111,52 @@ def fuzzy_search(sub, text, max_typos=3, word_borders=False, best_match=True, ig
     :param best_match: if True returns the best match, otherwise returns the first enhanced match (i.e. with minimized
     typos). See regex BEST_MATCH and ENHANCED_MATCH flags for details.
     :param ignore_case: if True, ignores the text casing.
+    :param engine: "regex" uses the regex module fuzzy matching (reference engine). "edlib" (default) uses a
+    bit-parallel infix alignment, which is much faster on long texts and with many typos, and returns the same span of
+    the "regex" engine. *word_borders* and *best_match=False* are only supported by the "regex" engine, which is used as
+    fallback in those cases.
     :return: None if no match is found, otherwise a tuple (start, end) containing span start and span end.
     """
-    sub = regex.escape(sub)
-    r_typos = r"" if max_typos is None else fr"<={max_typos}"
-    r_best_match = r"b" if best_match else r"e"
-    r_borders = r"\b" if word_borders else ""
-    r = r_borders + r'(?' + r_best_match + ')(' + sub + r'){e' + r_typos + r'}' + r_borders
-    result = regex.search(r, text, flags=regex.IGNORECASE if ignore_case else 0)
+    assert engine in ["regex", "edlib"], "engine can be either 'regex' or 'edlib'"
+    if engine == "edlib" and not word_borders and best_match:
+        return _edlib_fuzzy_search(sub, text, max_typos, ignore_case)
+    pattern = _compile_fuzzy_pattern(sub, max_typos, word_borders, best_match, ignore_case)
+    result = pattern.search(text)
     if result is None:
         return None
     else:
         return result.span()
 
 
+def range_intersections(a: List[Tuple], b: List[Tuple]):
+    """
+    Returns the intersections between two lists of (begin, end) ranges. Ranges that only touch each other (e.g. (2, 5)
+    and (5, 8)) produce an empty intersection (5, 5).
+    Overlapping pairs are found with a sweep line over the ranges sorted by begin, i.e. in O((n+m) log(n+m) + k) with k
+    the amount of intersections, instead of comparing every range of *a* with every range of *b*.
+    :param a: first list of (begin, end) ranges
+    :param b: second list of (begin, end) ranges
+    :return: list of (begin, end) intersections, ordered by the position of their ranges in *a*, then in *b*
+    """
+    # events sorted by begin: (begin, side, index). side 0 = a, side 1 = b
+    events = sorted([(r[0], 0, i) for i, r in enumerate(a)] + [(r[0], 1, j) for j, r in enumerate(b)])
+    ranges = (a, b)
+    active = ({}, {})  # ranges (of each side) whose begin has been seen and whose end has not been passed yet
+    ends = ([], [])  # heaps of (end, index), used to lazily remove the expired ranges from *active*
+    pairs = []
+    for begin, side, index in events:
+        other = 1 - side
+        while len(ends[other]) > 0 and ends[other][0][0] < begin:
+            _, expired = heapq.heappop(ends[other])
+            del active[other][expired]
+        for other_index in active[other]:
+            pairs.append((index, other_index) if side == 0 else (other_index, index))
+        active[side][index] = True
+        heapq.heappush(ends[side], (ranges[side][index][1], index))
+    pairs.sort()
+    return [(max(a[i][0], b[j][0]), min(a[i][1], b[j][1])) for i, j in pairs]
+
+
 def find_span_annotation_intersections(
         text: str,
         spans_annotations: List[List[str]],
@@ -45,6 +165,7 @@ def find_span_annotation_intersections(
         return_occurrences: bool = False,
         merge_contiguous_spans: bool = True,
         *args,
+        aligner=None,
         **kwargs
 ):
     """
@@ -63,27 +184,30 @@ def find_span_annotation_intersections(
     :param merge_contiguous_spans: if True, merges contiguous spans. E.g. [5, 8], [8, 10] are merged into [5, 10]. This
     has effect only if *return_occurrences* is not True.
     :param args: arguments for fuzzy search
+    :param aligner: SpanAligner memoizing the fuzzy searches (only with *fuzzy* and keyword arguments for fuzzy search)
     :param kwargs: keyword arguments for fuzzy search
     :return: list of intersections (in char ranges)
     """
 
-    def _range_intersections(a, b):
-        return [(max(first[0], second[0]), min(first[1], second[1]))
-                for first in a for second in b
-                if max(first[0], second[0]) <= min(first[1], second[1])]
-
-    def _get_ranges_count(a):
+    def _get_ranges_count(text_length, spans):
         """
-        Given a list of indices and occurrences, groups the ranges based on occurrences
-        :param a: list of (index, occurrences)
-        :return: list of ((begin, end), occurrences)
+        Counts how many spans cover each char index (difference array: +1 at begin, -1 at end, then cumulative sum) and
+        groups contiguous indices with the same count
+        :param text_length: length of the text
+        :param spans: list of (begin, end)
+        :return: list of ((begin, end), occurrences), covering the whole text
         """
-        a = sorted(a)
-        r = []
-        for k, group in groupby(a, lambda x: x[1]):
-            g = list(group)
-            r.append(((g[0][0], g[-1][0] + 1), k))
-        return r
+        if text_length == 0:
+            return []
+        diff = np.zeros(text_length + 1, dtype=np.int64)
+        if len(spans) > 0:
+            spans = np.asarray(spans, dtype=np.int64).reshape(-1, 2)
+            np.add.at(diff, spans[:, 0], 1)
+            np.add.at(diff, spans[:, 1], -1)
+        counts = np.cumsum(diff[:-1])
+        begins = np.concatenate(([0], np.flatnonzero(np.diff(counts)) + 1))
+        ends = np.append(begins[1:], text_length)
+        return [((b, e), k) for b, e, k in zip(begins.tolist(), ends.tolist(), counts[begins].tolist())]
 
     assert type(spans_annotations) is list and len(spans_annotations) > 0, "spans_annotations format wrong"
 
@@ -96,7 +220,11 @@ def find_span_annotation_intersections(
         for span in annot:
             assert type(span) is str, "spans_annotations type must be List[List[str]]"
             if fuzzy:
-                s = fuzzy_search(span, text, *args, **kwargs)
+                if aligner is not None:
+                    assert len(args) == 0, "Fuzzy search arguments must be passed as keyword arguments with an aligner"
+                    s = aligner.fuzzy_search(span, text, **kwargs)
+                else:
+                    s = fuzzy_search(span, text, *args, **kwargs)
                 if s is None:
                     raise ValueError(f"Could not find span '{span}' in text '{text}'. "
                                      f"Try using increasing the amount of possible typos with max_typos=N!")
@@ -114,14 +242,7 @@ def find_span_annotation_intersections(
     if type(occurrences_adjudication) is int or (type(occurrences_adjudication) is bool and occurrences_adjudication is True):
         if type(occurrences_adjudication) is bool and occurrences_adjudication is True:
             occurrences_adjudication = 1
-        occ = list(range(len(text)))
-        for annot in annot_span_positions:
-            for span in annot:
-                occ += list(range(span[0], span[1]))
-        c = Counter(occ)
-        c.subtract(Counter(list(range(len(text)))))
-        occ = sorted(c.most_common())
-        result = _get_ranges_count(occ)
+        result = _get_ranges_count(len(text), flatten_spans(annot_span_positions))
         result = list(filter(lambda x: x[1] >= occurrences_adjudication, result))
         if not return_occurrences:
             result = [r[0] for r in result]
@@ -139,38 +260,172 @@ def find_span_annotation_intersections(
     else:  # return spans intersections
         result = annot_span_positions[0]
         for i in range(1, len(annot_span_positions)):
-            result = _range_intersections(result, annot_span_positions[i])
+            result = range_intersections(result, annot_span_positions[i])
 
     return result
 
-def longest_common_substring(s1, s2, return_indices=True):
+class SuffixAutomaton:
+    '''
+    Suffix automaton of a sequence (a string or a list of hashable tokens), built in O(n). It recognizes all the
+    substrings of the sequence and is used to find longest common substrings in linear time.
+    '''
+    def __init__(self, seq):
+        '''
+        :param seq: the sequence (string or list of hashable elements)
+        '''
+        # state 0 is the initial state. For each state: outgoing transitions, suffix link and length of the longest
+        # substring it recognizes
+        self.next, self.link, self.length = [{}], [-1], [0]
+        last = 0
+        for c in seq:
+            cur = len(self.length)
+            self.next.append({})
+            self.link.append(0)
+            self.length.append(self.length[last] + 1)
+            p = last
+            while p != -1 and c not in self.next[p]:
+                self.next[p][c] = cur
+                p = self.link[p]
+            if p != -1:
+                q = self.next[p][c]
+                if self.length[p] + 1 == self.length[q]:
+                    self.link[cur] = q
+                else:
+                    clone = len(self.length)
+                    self.next.append(dict(self.next[q]))
+                    self.link.append(self.link[q])
+                    self.length.append(self.length[p] + 1)
+                    while p != -1 and self.next[p].get(c) == q:
+                        self.next[p][c] = clone
+                        p = self.link[p]
+                    self.link[q] = clone
+                    self.link[cur] = clone
+            last = cur
+
+    def longest_common_substring(self, s1):
+        '''
+        Finds the longest substring of *s1* that also appears in the automaton sequence. Among substrings of equal
+        length, the one ending first in *s1* is returned.
+        :param s1: the sequence to match against the automaton
+        :return: (begin, end) indices in s1. (0, 0) if there is no common element.
+        '''
+        state, current, longest, x_longest = 0, 0, 0, 0
+        for x, c in enumerate(s1, start=1):
+            while state != 0 and c not in self.next[state]:
+                state = self.link[state]
+                current = self.length[state]
+            if c in self.next[state]:
+                state = self.next[state][c]
+                current += 1
+            if current > longest:
+                longest, x_longest = current, x
+        return x_longest - longest, x_longest
+
+
+def longest_common_substring(s1, s2, return_indices=True, automaton=None):
     '''
     Solution to longest common substring problem. Can also be used with lists (longest common subsequence)
+    Runs in O(len(s1) + len(s2)) using a suffix automaton of s2.
     :param s1: first string
     :param s2: second string
     :param return_indices: whether to return indices (in s1) or substring
+    :param automaton: SuffixAutomaton of s2, if already built (e.g. when s2 is searched many times)
     :return: longest common substring. (indices refer to s1)
     '''
-    m = [[0] * (1 + len(s2)) for _ in range(1 + len(s1))]
-    longest, x_longest = 0, 0
-    for x in range(1, 1 + len(s1)):
-       for y in range(1, 1 + len(s2)):
-           if s1[x - 1] == s2[y - 1]:
-               m[x][y] = m[x - 1][y - 1] + 1
-               if m[x][y] > longest:
-                   longest = m[x][y]
-                   x_longest = x
-           else:
-               m[x][y] = 0
-    return x_longest - longest, x_longest if return_indices else s1[x_longest - longest: x_longest]
-
-def split_longest_common_substrings(sub, text, tokenizer, max_typos=1):
+    if automaton is None:
+        automaton = SuffixAutomaton(s2)
+    begin, x_longest = automaton.longest_common_substring(s1)
+    return begin, x_longest if return_indices else s1[begin: x_longest]
+
+class TextTokenIndex:
+    '''
+    Per-text index used by split_longest_common_substrings. It is built once per text and can be shared by all the
+    spans (e.g. cue, target, stimulus and experiencer annotations) searched in the same text.
+    It contains the text tokens, a lowercase token -> token dictionary for exact matches, the tokens bucketed by length
+    for bounded edit distance searches, and the suffix automata of the text (at word level and at char level).
+    '''
+    def __init__(self, text, tokenize=None):
+        '''
+        :param text: the text to index
+        :param tokenize: function that splits a string into a list of tokens. By default, words are matched with \\w+
+        (the shared get_tokenizer("word") tokenizer)
+        '''
+        self.text = text
+        self.tokenize = tokenize if tokenize is not None else get_tokenizer("word").tokenize
+        self.tokens = self.tokenize(text)
+        # lowercase token -> smallest original token (the same tie-breaking of sorting (distance, token) pairs)
+        self._exact = {}
+        for t in self.tokens:
+            lower = t.lower()
+            if lower not in self._exact or t < self._exact[lower]:
+                self._exact[lower] = t
+        self._buckets = {}
+        for lower, t in self._exact.items():
+            self._buckets.setdefault(len(lower), []).append((lower, t))
+        self._max_length = max(self._buckets.keys(), default=0)
+        self._list_automaton = None
+        self._str_automaton = None
+
+    @property
+    def list_automaton(self):
+        '''
+        :return: SuffixAutomaton of the lowercased text tokens
+        '''
+        if self._list_automaton is None:
+            self._list_automaton = SuffixAutomaton([x.lower() for x in self.tokens])
+        return self._list_automaton
+
+    @property
+    def str_automaton(self):
+        '''
+        :return: SuffixAutomaton of the lowercased text
+        '''
+        if self._str_automaton is None:
+            self._str_automaton = SuffixAutomaton(self.text.lower())
+        return self._str_automaton
+
+    def best_match(self, word, max_typos=1):
+        '''
+        Finds the text token closest to *word* (case insensitive edit distance). Ties are broken by choosing the smallest
+        token. Exact matches are found with a dictionary lookup, otherwise only tokens whose length differs from
+        len(word) by at most the best distance found so far (and at most *max_typos*) are compared.
+        :param word: the word to search
+        :param max_typos: maximum edit distance. If None, an unlimited number of typos will be considered.
+        :return: a tuple (edit_distance, token), or None if there is no token within *max_typos* edits
+        '''
+        word = word.lower()
+        if word in self._exact:
+            return 0, self._exact[word]
+        best_dist, best_token = None, None
+        d = 0  # length difference (a lower bound of the edit distance)
+        while (best_dist is None or d <= best_dist) and (max_typos is None or d <= max_typos):
+            for length in {len(word) - d, len(word) + d}:
+                for lower, t in self._buckets.get(length, []):
+                    k = best_dist if best_dist is not None else (-1 if max_typos is None else max_typos)
+                    dist = edlib.align(lower, word, k=k)["editDistance"]
+                    if dist == -1:
+                        continue
+                    if best_dist is None or dist < best_dist or (dist == best_dist and t < best_token):
+                        best_dist, best_token = dist, t
+            if len(word) - d < 0 and len(word) + d > self._max_length:
+                break
+            d += 1
+        if best_dist is None:
+            return None
+        return best_dist, best_token
+
+
+def split_longest_common_substrings(sub, text, tokenizer=None, max_typos=1, index=None):
     '''
 
     :param sub: the substring to search
     :param text: text to search in
+    :param tokenizer: function that splits a string into a list of tokens (e.g. get_tokenizer("word").tokenize, the
+    default). Ignored if *index* is given, since *sub* must be tokenized as the text was.
     :param max_typos: Uses fuzzy_search to search a span with typos in *text*. If None, an unlimited number of typos
     will be considered.
+    :param index: TextTokenIndex of *text*. Pass it when searching many spans in the same text, so that the text is
+    tokenized and indexed only once.
     :return: The string splitted in an optimal manner.
     '''
     def _split_list(_sub: list, _text: list):
@@ -190,7 +445,7 @@ def split_longest_common_substrings(sub, text, tokenizer, max_typos=1):
             #      done by forcing longest_common_substring to return the found indices also for s2, and using the
             #      returned s2 indices as X and Y (i.e. in this case, the indices finding the span in _text).
             # _.lower() is necessary to avoid a bug associating wrong word if capitalized in a different way
-            lcs = longest_common_substring([x.lower() for x in _sub], [x.lower() for x in _text], return_indices=True)
+            lcs = longest_common_substring([x.lower() for x in _sub], None, return_indices=True, automaton=index.list_automaton)
             return _split_list(_sub[: lcs[0]], _text) + [" ".join(_sub[lcs[0]:lcs[1]])] + _split_list(_sub[lcs[1]:], _text)
 
     def _split_str(_sub: str, _text: str):
@@ -210,23 +465,23 @@ def split_longest_common_substrings(sub, text, tokenizer, max_typos=1):
             #      done by forcing longest_common_substring to return the found indices also for s2, and using the
             #      returned s2 indices as X and Y (i.e. in this case, the indices finding the span in _text).
             # _.lower() is necessary to avoid a bug associating wrong word if capitalized in a different way
-            lcs = longest_common_substring(_sub.lower(), _text.lower(), return_indices=True)
+            lcs = longest_common_substring(_sub.lower(), None, return_indices=True, automaton=index.str_automaton)
             return _split_str(_sub[: lcs[0]].strip(), _text) + [_sub[lcs[0]:lcs[1]]] + _split_str(_sub[lcs[1]:].strip(), _text)
 
 
-    tokenizer = RegexpTokenizer(r'\w+')
-    sub_split = tokenizer.tokenize(sub) # word_tokenize(sub.replace(".", " . "))
-    text_split = tokenizer.tokenize(text) # word_tokenize(text.replace(".", " . "))
+    if index is None:
+        index = TextTokenIndex(text, tokenizer)
+    assert index.text == text, "index must be built on text"
+    sub_split = index.tokenize(sub) # word_tokenize(sub.replace(".", " . "))
+    text_split = index.tokens # word_tokenize(text.replace(".", " . "))
     if len(text_split) == 0:
         return None
     for w in range(len(sub_split)):
-        # a list composed of tuples [edit_distance, word]
-        ordered_matches = sorted([(edlib.align(x.lower(), sub_split[w].lower())["editDistance"], x) for x in text_split])
-        edit_dist, best_match = ordered_matches[0]
-        if edit_dist > max_typos:
+        match = index.best_match(sub_split[w], max_typos=max_typos)
+        if match is None:
             return None
         else:
-            sub_split[w] = best_match
+            sub_split[w] = match[1]
     first_split = _split_list(sub_split, text_split)  # spell correction, typos and copypaste correction
     second_split = deep_flatten([_split_str(s, text) for s in first_split])  # real splitting on original text
     return second_split
@@ -263,4 +518,117 @@ def end_overlap(a, b):
     for i in range(0, len(a)):
         if b.startswith(a[-i:]):
             return i
-    return 0
\ No newline at end of file
+    return 0
+
+class SpanAligner:
+    '''
+    Memoized span alignment: the results of fuzzy_search and split_longest_common_substrings are stored in a SQLite
+    table keyed by the hash of the function, its inputs and its parameters, so that the same (span, text) pairs (e.g.
+    the same span annotated by several annotators, or all the spans of a build that is run again) are aligned only
+    once. Results computed by a different version of the alignment code (see *namespace*) are discarded on opening.
+    Writes are buffered: call flush() (or close()) to store them. Each process must open its own SpanAligner.
+    E.g. with SpanAligner("alignments.sqlite") as aligner: aligner.fuzzy_search("obama", "I love Obama", max_typos=1)
+    '''
+    def __init__(self, path=None, namespace=None, flush_every=1024):
+        '''
+        :param path: SQLite file path. If None, the memo table is only kept in memory
+        :param namespace: version of the cached results. If None, the fingerprint of the utils code they depend on is
+        used, so that changing the alignment code invalidates the stored results
+        :param flush_every: amount of new results after which they are written to disk automatically
+        '''
+        if namespace is None:
+            namespace = fingerprint_files(["strings.py", "tokenizers.py", "data.py", "cache.py"],
+                                          root=os.path.dirname(os.path.abspath(__file__)))
+        self.path, self.namespace, self.flush_every = path, namespace, flush_every
+        # several processes (e.g. the adjudication workers) can share the same file
+        self._db = sqlite3.connect(":memory:" if path is None else path, timeout=60)
+        if path is not None:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS alignments (key TEXT PRIMARY KEY, value TEXT)")
+            stored = self._db.execute("SELECT value FROM meta WHERE name = 'namespace'").fetchone()
+            if stored is None or stored[0] != namespace:
+                self._db.execute("DELETE FROM alignments")
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES ('namespace', ?)", (namespace,))
+        self._pending = {}
+        self.hits, self.misses = 0, 0
+
+    @staticmethod
+    def _key(function, *args, **kwargs):
+        return hashlib.sha256(json.dumps([function, args, kwargs], sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _get(self, key):
+        if key in self._pending:
+            self.hits += 1
+            return True, self._pending[key]
+        row = self._db.execute("SELECT value FROM alignments WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        return True, json.loads(row[0])
+
+    def _put(self, key, value):
+        self._pending[key] = value
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+
+    def fuzzy_search(self, sub, text, **kwargs):
+        '''
+        Memoized fuzzy_search (see fuzzy_search for the parameters).
+        :return: tuple (begin, end) or None
+        '''
+        key = self._key("fuzzy_search", sub, text, **kwargs)
+        found, span = self._get(key)
+        if not found:
+            span = fuzzy_search(sub, text, **kwargs)
+            self._put(key, span)
+        return tuple(span) if span is not None else None
+
+    def split_longest_common_substrings(self, sub, text, tokenizer="word", max_typos=1, index=None):
+        '''
+        Memoized split_longest_common_substrings.
+        :param tokenizer: name of the utils.tokenizers tokenizer (a name, and not a function, so that it can be part
+        of the key)
+        :param index: TextTokenIndex of *text*, built with the same tokenizer. Only used on a cache miss
+        See split_longest_common_substrings for the other parameters.
+        :return: list of strings or None
+        '''
+        tokenize = get_tokenizer(tokenizer).tokenize
+        assert index is None or index.tokenize == tokenize, "index must be built with the same tokenizer"
+        key = self._key("split_longest_common_substrings", sub, text, tokenizer=tokenizer, max_typos=max_typos)
+        found, split = self._get(key)
+        if not found:
+            split = split_longest_common_substrings(sub, text, tokenize, max_typos=max_typos, index=index)
+            self._put(key, split)
+        return split
+
+    def flush(self):
+        '''
+        Writes the new results to the SQLite table.
+        '''
+        if len(self._pending) > 0:
+            with self._db:
+                self._db.executemany("INSERT OR REPLACE INTO alignments VALUES (?, ?)",
+                                     [(k, json.dumps(v)) for k, v in self._pending.items()])
+            self._pending = {}
+
+    def info(self):
+        '''
+        :return: a utils.cache.CacheInfo(hits, misses, evictions, size, maxsize) namedtuple, where size is the amount of
+        stored (and pending) results. Nothing is ever evicted and the size is unbounded
+        '''
+        size = self._db.execute("SELECT COUNT(*) FROM alignments").fetchone()[0] + len(self._pending)
+        return CacheInfo(self.hits, self.misses, 0, size, None)
+
+    def close(self):
+        self.flush()
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
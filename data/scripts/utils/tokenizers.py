@@ -0,0 +1,85 @@
+from utils.cache import LRUCache
+
+
+# NLTK is only imported (and Punkt only loaded) when a tokenizer is first used
+def _word_tokenizer():
+    from nltk.tokenize import RegexpTokenizer
+    return RegexpTokenizer(r'\w+')
+
+
+def _tweet_tokenizer():
+    from nltk.tokenize import TweetTokenizer
+    return TweetTokenizer()
+
+
+def _sentence_tokenizer():
+    # the same tokenizer loaded by nltk sent_tokenize at each call
+    from nltk.data import load
+    return load("tokenizers/punkt/english.pickle")
+
+
+# name -> function building the tokenizer
+_TOKENIZER_FACTORIES = {
+    "word": _word_tokenizer,
+    "tweet": _tweet_tokenizer,
+    "sentence": _sentence_tokenizer
+}
+_TOKENIZERS = {}
+
+
+class CachedTokenizer:
+    '''
+    Wraps a tokenizer (any object with a tokenize(text) method, e.g. the NLTK ones) memoizing its results, since the
+    same texts are tokenized many times (e.g. the same span annotated by several annotators of the same tweet).
+    '''
+    def __init__(self, tokenizer, maxsize=1 << 16):
+        '''
+        :param tokenizer: the wrapped tokenizer
+        :param maxsize: maximum amount of memoized texts (see utils.cache.LRUCache)
+        '''
+        self.tokenizer = tokenizer
+        self._cache = LRUCache(maxsize=maxsize)
+
+    def tokenize(self, text):
+        '''
+        :param text: the text to tokenize
+        :return: list of tokens (a new list at each call, so callers can modify it)
+        '''
+        tokens = self._cache.get(text)
+        if tokens is None:
+            tokens = tuple(self.tokenizer.tokenize(text))
+            self._cache.put(text, tokens)
+        return list(tokens)
+
+    def cache_info(self):
+        '''
+        :return: a utils.cache.CacheInfo namedtuple with the statistics of the memoized texts
+        '''
+        return self._cache.info()
+
+    def cache_clear(self):
+        self._cache.clear()
+
+
+def register_tokenizer(name, factory):
+    '''
+    Adds (or replaces) a tokenizer of the registry.
+    :param name: tokenizer name, used with get_tokenizer
+    :param factory: function without arguments returning the tokenizer. It is called once, on first use
+    '''
+    _TOKENIZER_FACTORIES[name] = factory
+    _TOKENIZERS.pop(name, None)
+
+
+def get_tokenizer(name="word"):
+    '''
+    Returns the shared, memoized instance of a tokenizer, built on first use. Available tokenizers are "word" (\\w+
+    words), "tweet" (nltk TweetTokenizer), "sentence" (English Punkt, as nltk sent_tokenize) and the registered ones.
+    E.g. get_tokenizer("sentence").tokenize(text) is sent_tokenize(text), without loading Punkt at each call.
+    :param name: tokenizer name
+    :return: CachedTokenizer
+    '''
+    if name not in _TOKENIZERS:
+        assert name in _TOKENIZER_FACTORIES, f"Unknown tokenizer '{name}'. Available: {sorted(_TOKENIZER_FACTORIES)}"
+        _TOKENIZERS[name] = CachedTokenizer(_TOKENIZER_FACTORIES[name]())
+    return _TOKENIZERS[name]
@@ -0,0 +1,146 @@
+import regex
+import numpy as np
+
+# role labels, in the order of the last axis of the label arrays
+ROLES = ["cue", "experiencer", "target", "cause"]
+# BIO tags
+O, B, I = 0, 1, 2
+# words, single CJK characters (NTCIR Chinese has no spaces) and single punctuation marks
+TOKEN_PATTERN = r"\p{Han}|[^\W\p{Han}]+|[^\w\s]"
+_TOKEN_REGEXP = regex.compile(TOKEN_PATTERN)
+
+
+def token_offsets(text, pattern=None):
+    '''
+    :param text: the text to tokenize
+    :param pattern: token regex. If None, TOKEN_PATTERN is used
+    :return: int32 array of shape (tokens, 2) with the [begin, end) char offsets of each token
+    '''
+    regexp = _TOKEN_REGEXP if pattern is None else regex.compile(pattern)
+    offsets = [m.span() for m in regexp.finditer(text)]
+    return np.array(offsets, dtype=np.int32).reshape(-1, 2)
+
+
+def bio_labels(offsets, spans):
+    '''
+    Tags the tokens overlapping the char spans: the first token of each span is B, the others I, the remaining O.
+    Spans that do not refer to the text (e.g. the (-1, -1) author experiencers and targets of Elections) are ignored.
+    E.g. offsets of "I love pizza" and spans [(2, 12)] give [O, B, I].
+    :param offsets: int array of shape (tokens, 2), see token_offsets
+    :param spans: list of [begin, end) char spans
+    :return: int8 array of shape (tokens,)
+    '''
+    labels = np.full(len(offsets), O, dtype=np.int8)
+    spans = np.array(spans, dtype=np.int64).reshape(-1, 2)
+    spans = spans[(spans[:, 0] >= 0) & (spans[:, 1] > spans[:, 0])]
+    if len(spans) == 0 or len(offsets) == 0:
+        return labels
+    # (spans, tokens) overlap matrix
+    overlap = (offsets[None, :, 0] < spans[:, 1, None]) & (offsets[None, :, 1] > spans[:, 0, None])
+    labels[overlap.any(axis=0)] = I
+    found = overlap.any(axis=1)
+    labels[overlap[found].argmax(axis=1)] = B
+    return labels
+
+
+class TokenIndex:
+    '''
+    Token boundaries and BIO role labels of all the records of a SRL4E file, computed once and stored in a .npz file,
+    so that training and evaluation do not need to tokenize and align the char spans again.
+    The arrays of all the records are concatenated: the tokens of record i are
+    token_offsets[token_pointers[i]:token_pointers[i + 1]], and the labels of emotion j (whose record is
+    emotion_records[j]) are labels[label_pointers[j]:label_pointers[j + 1]], with one row per token of its record and
+    one column per role (see ROLES).
+    '''
+    def __init__(self, ids, token_offsets, token_pointers, emotion_ids, emotion_records, labels, label_pointers):
+        self.ids = ids
+        self.token_offsets = token_offsets
+        self.token_pointers = token_pointers
+        self.emotion_ids = emotion_ids
+        self.emotion_records = emotion_records
+        self.labels = labels
+        self.label_pointers = label_pointers
+        self._id2index = None
+        # emotion_pointers[i]:emotion_pointers[i + 1] are the emotions of record i (emotions are stored by record)
+        self.emotion_pointers = np.searchsorted(emotion_records, np.arange(len(ids) + 1)).astype(np.int64)
+
+    @classmethod
+    def from_records(cls, records, pattern=None):
+        '''
+        :param records: iterable of (index, record) tuples, e.g. utils.srl4e.iter_srl4e(path)
+        :param pattern: token regex. If None, TOKEN_PATTERN is used
+        :return: TokenIndex
+        '''
+        ids, offsets, emotion_ids, emotion_records, labels = [], [], [], [], []
+        for i, (index, record) in enumerate(records):
+            ids.append(index)
+            record_offsets = token_offsets(record["text"], pattern)
+            offsets.append(record_offsets)
+            for emotion_index, emotion in sorted(record["emotions"].items()):
+                emotion_ids.append(emotion_index)
+                emotion_records.append(i)
+                roles = emotion["roles"]
+                labels.append(np.stack([bio_labels(record_offsets, roles.get(r, [])) for r in ROLES], axis=1)
+                              if len(record_offsets) > 0 else np.zeros((0, len(ROLES)), dtype=np.int8))
+        return cls(
+            np.array(ids, dtype=str),
+            np.concatenate(offsets) if len(offsets) > 0 else np.zeros((0, 2), dtype=np.int32),
+            np.cumsum([0] + [len(o) for o in offsets], dtype=np.int64),
+            np.array(emotion_ids, dtype=str),
+            np.array(emotion_records, dtype=np.int32),
+            np.concatenate(labels) if len(labels) > 0 else np.zeros((0, len(ROLES)), dtype=np.int8),
+            np.cumsum([0] + [len(l) for l in labels], dtype=np.int64)
+        )
+
+    def save(self, path):
+        '''
+        :param path: path of the .npz file
+        '''
+        np.savez(path, ids=self.ids, token_offsets=self.token_offsets, token_pointers=self.token_pointers,
+                 emotion_ids=self.emotion_ids, emotion_records=self.emotion_records, labels=self.labels,
+                 label_pointers=self.label_pointers, roles=np.array(ROLES))
+
+    @classmethod
+    def load(cls, path):
+        '''
+        :param path: path of a .npz file written by TokenIndex.save
+        :return: TokenIndex
+        '''
+        with np.load(path) as data:
+            assert list(data["roles"]) == ROLES, f"{path} was built with roles {list(data['roles'])}, expected {ROLES}"
+            return cls(data["ids"], data["token_offsets"], data["token_pointers"], data["emotion_ids"],
+                       data["emotion_records"], data["labels"], data["label_pointers"])
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def lengths(self):
+        '''
+        :return: int64 array with the amount of tokens of each record
+        '''
+        return np.diff(self.token_pointers)
+
+    def index_of(self, index):
+        '''
+        :param index: record id (e.g. "gne.0000042")
+        :return: position of the record
+        '''
+        if self._id2index is None:
+            self._id2index = {str(x): i for i, x in enumerate(self.ids)}
+        return self._id2index[index]
+
+    def offsets(self, i):
+        '''
+        :param i: position of the record
+        :return: int32 array of shape (tokens, 2) with the char offsets of its tokens
+        '''
+        return self.token_offsets[self.token_pointers[i]:self.token_pointers[i + 1]]
+
+    def emotion_labels(self, i):
+        '''
+        :param i: position of the record
+        :return: dict emotion id -> int8 array of shape (tokens, len(ROLES)) with the BIO tags of each role
+        '''
+        return {str(self.emotion_ids[j]): self.labels[self.label_pointers[j]:self.label_pointers[j + 1]]
+                for j in range(self.emotion_pointers[i], self.emotion_pointers[i + 1])}